@@ -0,0 +1,90 @@
+import threading
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+from typing import Dict, Iterable, List, Tuple
+
+from event_store import EventStore
+
+
+class IntervalIndex:
+    """Static interval index over one calendar's busy time.
+
+    Intervals are kept in arrays sorted by start, alongside a running
+    maximum of end times. An overlap query bisects both arrays to narrow the
+    candidates to a contiguous slice, so it costs O(log n + k).
+    """
+
+    def __init__(self, intervals: Iterable[Tuple[float, float, str]]):
+        ordered = sorted(intervals)
+        self.starts = [start for start, _, _ in ordered]
+        self.ends = [end for _, end, _ in ordered]
+        self.ids = [event_id for _, _, event_id in ordered]
+        self.max_ends = list(accumulate(self.ends, max))
+
+    def overlapping(self, start: float, end: float) -> List[Tuple[float, float, str]]:
+        # Nothing before `lo` can reach past `start`; nothing from `hi` on starts before `end`
+        lo = bisect_right(self.max_ends, start)
+        hi = bisect_left(self.starts, end)
+        return [
+            (self.starts[i], self.ends[i], self.ids[i])
+            for i in range(lo, hi)
+            if self.ends[i] > start
+        ]
+
+
+class AvailabilityEngine:
+    """Free/busy answers from the local event store, without freebusy API calls.
+
+    One IntervalIndex per calendar is rebuilt lazily whenever the store
+    reports that calendar changed. Recurring series have no end, so their
+    occurrences are expanded per query window instead of being indexed.
+    """
+
+    def __init__(self, store: EventStore):
+        self.store = store
+        self._indexes: Dict[str, Tuple[int, IntervalIndex]] = {}
+        self._lock = threading.Lock()
+
+    def index(self, calendar_id: str) -> IntervalIndex:
+        version = self.store.version(calendar_id)
+        cached = self._indexes.get(calendar_id)
+        if cached is None or cached[0] != version:
+            with self._lock:
+                cached = self._indexes.get(calendar_id)
+                if cached is None or cached[0] != version:
+                    cached = (version, IntervalIndex(self.store.busy_intervals(calendar_id)))
+                    self._indexes[calendar_id] = cached
+        return cached[1]
+
+    def conflicts(self, calendar_ids: List[str], start: float, end: float) -> List[Tuple[str, float, float, str]]:
+        """(calendar_id, start, end, event_id) for busy intervals overlapping [start, end)."""
+        found = []
+        for calendar_id in calendar_ids:
+            found += [(calendar_id, *interval) for interval in self.index(calendar_id).overlapping(start, end)]
+            found += [(calendar_id, *interval) for interval in self.store.recurring_intervals(calendar_id, start, end)]
+        return sorted(found, key=lambda item: (item[1], item[2]))
+
+    def free_periods(self, calendar_ids: List[str], start: float, end: float, duration: float) -> List[Tuple[float, float]]:
+        """Gaps of at least `duration` seconds in [start, end) that are free in every calendar."""
+        busy = sorted((s, e) for _, s, e, _ in self.conflicts(calendar_ids, start, end))
+        periods, cursor = [], start
+        for busy_start, busy_end in busy:
+            if busy_start - cursor >= duration:
+                periods.append((cursor, busy_start))
+            cursor = max(cursor, busy_end)
+        if end - cursor >= duration:
+            periods.append((cursor, end))
+        return periods
+
+    def slots(self, calendar_ids: List[str], start: float, end: float, duration: float,
+              step: float, limit: int = 20) -> List[Tuple[float, float]]:
+        """Candidate slots of length `duration`, starting every `step` seconds inside free periods."""
+        slots = []
+        for period_start, period_end in self.free_periods(calendar_ids, start, end, duration):
+            slot_start = period_start
+            while slot_start + duration <= period_end and len(slots) < limit:
+                slots.append((slot_start, slot_start + duration))
+                slot_start += step
+            if len(slots) >= limit:
+                break
+        return slots
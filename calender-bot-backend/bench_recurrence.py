@@ -0,0 +1,209 @@
+"""Payload size and latency of server-side (singleEvents=True) vs local recurrence expansion.
+
+    python bench_recurrence.py [--series 30] [--history-days 365] [--horizon-days 365] [--window-days 7]
+                               [--rtt 0.05] [--before cde4a35~1]
+
+Builds a calendar of recurring series (weekday standups, weeklies,
+fortnightlies, monthlies, some with EXDATEs) starting --history-days ago.
+Each series has a few moved and cancelled instances, and there are some
+one-off events. A first sync of that calendar is served through
+HttpMockSequence in two shapes:
+
+  server  what events.list returns with singleEvents=True: every instance
+          from each series' start to --horizon-days ahead, with overrides
+          applied. This is stored by EventStore as of --before, the last
+          version that synced this way.
+  local   what it returns with singleEvents=False: masters, overrides and
+          one-off events. This is stored by the current EventStore, which
+          expands series on read.
+
+Both shapes are paged at 2500 items like the API, and each page costs
+--rtt on top of parsing. Google's own expansion horizon for unbounded
+series isn't documented, so --horizon-days is an assumption.
+
+The script then reads the next --window-days twice: cold, then again, when
+local expansion is memoized. It checks that both stores return the same
+events for that window.
+"""
+import argparse
+import importlib.util
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import List, Tuple
+from zoneinfo import ZoneInfo
+
+from googleapiclient.discovery import build
+from googleapiclient.http import HttpMockSequence
+
+from event_store import EventStore
+from recurrence import expand
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CALENDAR_ID = "primary"
+TIMEZONE = "Asia/Kolkata"
+PAGE_SIZE = 2500
+RULES = [
+    ("Standup", "RRULE:FREQ=DAILY;BYDAY=MO,TU,WE,TH,FR", 15),
+    ("Team sync", "RRULE:FREQ=WEEKLY;BYDAY=TU", 60),
+    ("1:1", "RRULE:FREQ=WEEKLY;INTERVAL=2;BYDAY=TH", 30),
+    ("Planning", "RRULE:FREQ=MONTHLY;BYDAY=1MO", 90),
+]
+
+
+class DelayedMockSequence(HttpMockSequence):
+    """HttpMockSequence that takes `rtt` seconds per response."""
+
+    def __init__(self, iterable, rtt: float):
+        super().__init__(iterable)
+        self.rtt = rtt
+
+    def request(self, *args, **kwargs):
+        time.sleep(self.rtt)
+        return super().request(*args, **kwargs)
+
+
+def event_fields(rng: random.Random, summary: str, index: int) -> dict:
+    """The bulk of a Calendar event resource besides its times, roughly as the API returns it."""
+    attendees = [{"email": f"person{rng.randint(1, 500)}@example.com", "responseStatus": "accepted"}
+                 for _ in range(rng.randint(2, 8))]
+    return {
+        "kind": "calendar#event", "etag": f"\"{rng.getrandbits(48)}\"", "status": "confirmed",
+        "htmlLink": f"https://www.google.com/calendar/event?eid={rng.getrandbits(64):x}",
+        "created": "2024-01-02T10:00:00.000Z", "updated": "2024-06-01T12:00:00.000Z",
+        "summary": f"{summary} #{index}", "description": "Agenda and notes in the shared doc.",
+        "creator": {"email": "owner@example.com", "self": True}, "organizer": {"email": "owner@example.com", "self": True},
+        "attendees": attendees, "iCalUID": f"{rng.getrandbits(64):x}@google.com", "sequence": 0,
+        "reminders": {"useDefault": True}, "eventType": "default",
+    }
+
+
+def build_calendar(series: int, history_days: int, horizon_days: int, seed: int = 0) -> Tuple[List[dict], List[dict]]:
+    """Return (server_items, local_items) for the same calendar."""
+    rng = random.Random(seed)
+    tz = ZoneInfo(TIMEZONE)
+    today = datetime.now(tz).replace(hour=0, minute=0, second=0, microsecond=0)
+    first_day, horizon = today - timedelta(days=history_days), today + timedelta(days=horizon_days)
+    server, local = [], []
+    for index in range(series):
+        summary, rule, minutes = RULES[index % len(RULES)]
+        start = first_day + timedelta(days=rng.randint(0, 6), hours=rng.randint(9, 17))
+        recurrence = [rule]
+        if rng.random() < 0.3:
+            skipped = start + timedelta(days=7 * rng.randint(1, 20))
+            recurrence.append(f"EXDATE;TZID={TIMEZONE}:{skipped.strftime('%Y%m%dT%H%M%S')}")
+        master = {
+            **event_fields(rng, summary, index), "id": f"series{index}", "recurrence": recurrence,
+            "start": {"dateTime": start.isoformat(), "timeZone": TIMEZONE},
+            "end": {"dateTime": (start + timedelta(minutes=minutes)).isoformat(), "timeZone": TIMEZONE},
+        }
+        local.append(master)
+        instances = [instance for _, _, instance in expand(master, tz, start.timestamp(), horizon.timestamp())]
+        changed = {position: rng.choice(("moved", "cancelled"))
+                   for position in rng.sample(range(len(instances)), min(4, len(instances)))}
+        for position, instance in enumerate(instances):
+            change = changed.get(position)
+            if change == "cancelled":
+                local.append({"kind": "calendar#event", "etag": instance["etag"], "id": instance["id"], "status": "cancelled",
+                              "recurringEventId": master["id"], "originalStartTime": instance["originalStartTime"]})
+                continue
+            if change == "moved":
+                moved_start = datetime.fromisoformat(instance["start"]["dateTime"]) + timedelta(hours=1)
+                moved_end = datetime.fromisoformat(instance["end"]["dateTime"]) + timedelta(hours=1)
+                instance = {**instance, "start": {"dateTime": moved_start.isoformat(), "timeZone": TIMEZONE},
+                            "end": {"dateTime": moved_end.isoformat(), "timeZone": TIMEZONE}}
+                local.append(instance)
+            server.append(instance)
+    for index in range(series * 5):
+        start = first_day + timedelta(days=rng.randint(0, history_days + horizon_days), hours=rng.randint(8, 19))
+        single = {**event_fields(rng, "Meeting", index), "id": f"single{index}",
+                  "start": {"dateTime": start.isoformat(), "timeZone": TIMEZONE},
+                  "end": {"dateTime": (start + timedelta(minutes=30)).isoformat(), "timeZone": TIMEZONE}}
+        server.append(single)
+        local.append(single)
+    return server, local
+
+
+def pages(items: List[dict]) -> List[Tuple[dict, str]]:
+    """events.list responses for a first sync, PAGE_SIZE items a page, the last carrying nextSyncToken."""
+    responses = []
+    for offset in range(0, len(items), PAGE_SIZE):
+        page = {"kind": "calendar#events", "items": items[offset:offset + PAGE_SIZE]}
+        if offset + PAGE_SIZE < len(items):
+            page["nextPageToken"] = f"page{offset + PAGE_SIZE}"
+        else:
+            page["nextSyncToken"] = "sync1"
+        responses.append(({"status": "200"}, json.dumps(page)))
+    return responses
+
+
+def load_event_store(ref: str, directory: str):
+    """EventStore as of git ref, loaded under another module name next to the current one."""
+    source = subprocess.run(["git", "show", f"{ref}:calender-bot-backend/event_store.py"], cwd=HERE, check=True,
+                            capture_output=True, text=True).stdout
+    path = os.path.join(directory, "event_store_server_expanded.py")
+    with open(path, "w") as f:
+        f.write(source)
+    spec = importlib.util.spec_from_file_location("event_store_server_expanded", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.EventStore
+
+
+def run(store, items: List[dict], rtt: float, window_days: int) -> dict:
+    responses = pages(items)
+    payload = {"pages": len(responses), "bytes": sum(len(content) for _, content in responses)}
+    # HttpMockSequence pops responses as it serves them, hence the count above
+    service = build("calendar", "v3", http=DelayedMockSequence(responses, rtt), static_discovery=True)
+    started = time.perf_counter()
+    store.sync(service, CALENDAR_ID, force=True)
+    synced = time.perf_counter() - started
+    time_min = time.time()
+    time_max = time_min + window_days * 86400
+    reads, window = [], None
+    for _ in range(2):
+        started = time.perf_counter()
+        window, _ = store.range(CALENDAR_ID, time_min, time_max, limit=PAGE_SIZE)
+        reads.append(time.perf_counter() - started)
+    return {"items": len(items), **payload, "sync": synced, "cold": reads[0], "warm": reads[1], "window": window}
+
+
+def main() -> int:
+    args = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    args.add_argument("--series", type=int, default=30)
+    args.add_argument("--history-days", type=int, default=365, help="how long ago the series started")
+    args.add_argument("--horizon-days", type=int, default=365, help="how far ahead the server expands")
+    args.add_argument("--window-days", type=int, default=7, help="span of the timed read")
+    args.add_argument("--rtt", type=float, default=0.05, help="seconds per events.list page")
+    args.add_argument("--before", default="cde4a35~1", help="git ref of the server-side expansion EventStore")
+    options = args.parse_args()
+
+    server_items, local_items = build_calendar(options.series, options.history_days, options.horizon_days)
+    with tempfile.TemporaryDirectory() as directory:
+        ServerExpandedStore = load_event_store(options.before, directory)
+        results = {
+            "server": run(ServerExpandedStore(os.path.join(directory, "server.db"), timezone=TIMEZONE),
+                          server_items, options.rtt, options.window_days),
+            "local": run(EventStore(os.path.join(directory, "local.db"), timezone=TIMEZONE),
+                         local_items, options.rtt, options.window_days),
+        }
+
+    print(f"{options.series} series over {options.history_days} days back and {options.horizon_days} ahead, "
+          f"{options.window_days}-day read, rtt {options.rtt * 1000:.0f}ms per page")
+    print(f"{'':>8}{'items':>8}{'pages':>7}{'bytes':>12}{'sync':>10}{'read cold':>11}{'read warm':>11}")
+    for name, result in results.items():
+        print(f"{name:>8}{result['items']:>8}{result['pages']:>7}{result['bytes']:>12,}{result['sync'] * 1000:>8.0f}ms"
+              f"{result['cold'] * 1000:>9.1f}ms{result['warm'] * 1000:>9.1f}ms")
+    server_window = [(event["id"], event["start"]["dateTime"]) for event in results["server"]["window"]]
+    local_window = [(event["id"], event["start"]["dateTime"]) for event in results["local"]["window"]]
+    print(f"{len(server_window)} events in the window, {'same' if server_window == local_window else 'DIFFERENT'} from both stores")
+    return 0 if server_window == local_window else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+"""Import time and time to ready for the calendar backend, baseline vs current.
+
+    python bench_startup.py [--baseline 7eab938] [--rtt 0.05] [--runs 15]
+
+Import: wall time of `python -c "import calender_app"` in a fresh
+subprocess, next to `python -c pass` as the interpreter's own floor. The
+working directory holds a throwaway service-account credentials.json. The
+import is also run without that file, which the baseline fails.
+
+Ready: the app runs under uvicorn in a fresh subprocess, and /health/ready
+is polled until it answers 200. An app without that route (the baseline
+answers 404) counts as ready once it answers at all. Then GET /calendars
+is timed, which is one calendarList.list in both versions.
+
+There is no network here, so the server child swaps httplib2 for a fake
+Google that answers after --rtt seconds. The baseline is exported from git
+at --baseline. Times are medians over --runs, in ms.
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def credentials_file(directory: str) -> str:
+    """Write a service-account file with a real (throwaway) RSA key, so google-auth can sign with it."""
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048).private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption(),
+    ).decode()
+    path = os.path.join(directory, "credentials.json")
+    with open(path, "w") as f:
+        json.dump({"type": "service_account", "project_id": "bench", "private_key_id": "bench", "private_key": key,
+                   "client_email": "bench@bench.iam.gserviceaccount.com", "client_id": "1",
+                   "token_uri": "https://oauth2.googleapis.com/token"}, f)
+    return path
+
+
+def fake_google(rtt: float):
+    """Replace httplib2.Http.request with canned Google answers delayed by rtt (server child only)."""
+    import httplib2
+
+    def request(self, uri, method="GET", body=None, headers=None, *args, **kwargs):
+        time.sleep(rtt)
+        if "oauth2" in uri:
+            content = {"access_token": "fake", "expires_in": 3600, "token_type": "Bearer"}
+        else:
+            content = {"items": [], "nextSyncToken": "sync1"}
+        return httplib2.Response({"status": "200", "content-type": "application/json"}), json.dumps(content).encode()
+
+    httplib2.Http.request = request
+
+
+def serve(app_dir: str, port: int, rtt: float):
+    """Server child: run app_dir/calender_app.py on port against the fake Google."""
+    import uvicorn
+
+    fake_google(rtt)
+    sys.path.insert(0, app_dir)
+    uvicorn.run("calender_app:app", host="127.0.0.1", port=port, log_level="warning")
+
+
+def time_python(code: str, workdir: str, app_dir: str = "") -> float:
+    """Wall time of `python -c code` in a fresh subprocess."""
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", code], cwd=workdir, check=True,
+                   env={**os.environ, "PYTHONPATH": app_dir}, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - started
+
+
+def imports_without_credentials(app_dir: str) -> bool:
+    with tempfile.TemporaryDirectory() as workdir:
+        return subprocess.run([sys.executable, "-c", "import calender_app"], cwd=workdir,
+                              env={**os.environ, "PYTHONPATH": app_dir}, capture_output=True).returncode == 0
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def status_of(url: str) -> int:
+    try:
+        with urllib.request.urlopen(url, timeout=60) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def time_ready(app_dir: str, workdir: str, rtt: float) -> dict:
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    child = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "--serve", app_dir, "--port", str(port), "--rtt", str(rtt)],
+        cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while True:
+            if child.poll() is not None:
+                raise RuntimeError(f"{app_dir}/calender_app.py exited with {child.returncode} before becoming ready")
+            try:
+                if status_of(f"{base}/health/ready") in (200, 404):
+                    break
+            except OSError:
+                pass
+            time.sleep(0.01)
+        ready = time.perf_counter() - started
+        request_started = time.perf_counter()
+        status = status_of(f"{base}/calendars")
+        if status != 200:
+            raise RuntimeError(f"first /calendars returned {status}")
+        first = time.perf_counter() - started
+        return {"ready": ready, "first": first, "first_latency": first - (request_started - started)}
+    finally:
+        child.terminate()
+        child.wait()
+
+
+def export_baseline(ref: str, directory: str) -> str:
+    """Write calender-bot-backend as of ref into directory and return its path."""
+    root = subprocess.run(["git", "rev-parse", "--show-toplevel"], cwd=HERE, check=True,
+                          capture_output=True, text=True).stdout.strip()
+    prefix = os.path.relpath(HERE, root)
+    archive = subprocess.run(["git", "archive", ref, prefix], cwd=root, check=True, capture_output=True).stdout
+    subprocess.run(["tar", "-x", "-C", directory], input=archive, check=True)
+    return os.path.join(directory, prefix)
+
+
+def main():
+    args = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    args.add_argument("--baseline", default="7eab938", help="git ref of the app to compare against")
+    args.add_argument("--rtt", type=float, default=0.05, help="seconds per fake Google round trip")
+    args.add_argument("--runs", type=int, default=15)
+    args.add_argument("--serve", help=argparse.SUPPRESS)
+    args.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    options = args.parse_args()
+    if options.serve:
+        serve(options.serve, options.port, options.rtt)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        versions = {options.baseline: export_baseline(options.baseline, directory), "current": HERE}
+        workdir = os.path.join(directory, "run")
+        os.makedirs(workdir)
+        credentials_file(workdir)
+
+        floor = statistics.median(time_python("pass", workdir) for _ in range(options.runs))
+        print(f"python -c pass: {floor * 1000:.0f}ms")
+        print(f"{'version':>10}{'import':>10}{'no creds':>10}{'ready':>10}{'first request':>15}{'first latency':>15}"
+              f"   (ms, median of {options.runs}; rtt {options.rtt * 1000:.0f}ms)")
+        for name, app_dir in versions.items():
+            imported = statistics.median(time_python("import calender_app", workdir, app_dir) for _ in range(options.runs))
+            runs = [time_ready(app_dir, workdir, options.rtt) for _ in range(options.runs)]
+            median = {key: statistics.median(run[key] for run in runs) * 1000 for key in runs[0]}
+            print(f"{name:>10}{imported * 1000:>10.0f}{'ok' if imports_without_credentials(app_dir) else 'fails':>10}"
+                  f"{median['ready']:>10.0f}{median['first']:>15.0f}{median['first_latency']:>15.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,33 +1,36 @@
-from fastapi import FastAPI, HTTPException
+import time
+
+PROCESS_START = time.perf_counter()
+
+import asyncio
+import base64
+import heapq
+import json
+import logging
+import os
+import threading
+from itertools import islice
+from typing import List, Optional
+from zoneinfo import ZoneInfo
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware  # ✅ Import this
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
 import datetime
 from dateutil import parser
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+from availability import AvailabilityEngine
+from event_store import EventStore
+from metrics import CACHE_REQUESTS, execute, install as install_metrics
 
-# FastAPI instance
-app = FastAPI()
-
-# ✅ Add CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["http://localhost:5173"],  # Or ["*"] to allow all
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+logger = logging.getLogger(__name__)
 
 # Constants
 SCOPES = ['https://www.googleapis.com/auth/calendar']
 SERVICE_ACCOUNT_FILE = 'credentials.json'
 TIMEZONE = 'Asia/Kolkata'
 YOUR_CALENDAR_ID = 'padgelwartrisha91@gmail.com'  # Replace with your calendar email
-
-# Google Calendar API service
-creds = service_account.Credentials.from_service_account_file(
-    SERVICE_ACCOUNT_FILE, scopes=SCOPES)
-service = build('calendar', 'v3', credentials=creds)
+LOCAL_TZ = ZoneInfo(TIMEZONE)
 
 # Request schemas
 class EventCreate(BaseModel):
@@ -41,25 +44,192 @@ class EventUpdate(BaseModel):
     start: str = None
     end: str = None
 
-@app.get("/events")
-def list_events():
+class CalendarClients:
+    """Everything that needs credentials or disk, built once per worker at startup.
+
+    Pass `http` (e.g. googleapiclient.http.HttpMockSequence) to run against a
+    fake transport; no credentials are read then and the bundled discovery
+    document is used. httplib2 clients aren't thread-safe, so each thread
+    gets its own service object sharing the same credentials.
+    """
+
+    def __init__(self, credentials_file: str = SERVICE_ACCOUNT_FILE, event_db_path: str = "events.db",
+                 http=None, sync_interval: float = 30.0):
+        from googleapiclient.discovery import build
+
+        if http is not None:
+            self._build = lambda: build('calendar', 'v3', http=http, static_discovery=True)
+        else:
+            from google.oauth2 import service_account
+
+            creds = service_account.Credentials.from_service_account_file(credentials_file, scopes=SCOPES)
+            self._build = lambda: build('calendar', 'v3', credentials=creds, static_discovery=True)
+        self._local = threading.local()
+        self.service  # Build one now so bad credentials fail at startup
+        # Local event store, kept current with Calendar syncToken incremental sync
+        self.event_store = EventStore(event_db_path, timezone=TIMEZONE, min_interval=sync_interval)
+        self.availability = AvailabilityEngine(self.event_store)
+
+    @property
+    def service(self):
+        service = getattr(self._local, "service", None)
+        if service is None:
+            service = self._local.service = self._build()
+        return service
+
+    def refresh(self, calendar_id: str):
+        if self.event_store.is_stale(calendar_id):
+            CACHE_REQUESTS.labels("events", "miss").inc()
+            self.event_store.sync(self.service, calendar_id)
+        else:
+            CACHE_REQUESTS.labels("events", "hit").inc()
+
+def clients(request: Request) -> CalendarClients:
+    built = getattr(request.app.state, "clients", None)
+    if built is None:
+        raise HTTPException(status_code=503, detail="Calendar client is not ready")
+    return built
+
+router = APIRouter()
+
+def parse_time_param(value: str):
     try:
-        now = datetime.datetime.utcnow().isoformat() + 'Z'
-        events_result = service.events().list(
-            calendarId=YOUR_CALENDAR_ID, timeMin=now,
-            maxResults=10, singleEvents=True, orderBy='startTime'
-        ).execute()
-
-        events = events_result.get('items', [])
-        return {"events": events}
+        parsed = parser.parse(value)
+    except (ValueError, OverflowError):
+        raise HTTPException(status_code=400, detail=f"Invalid datetime: {value}")
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=LOCAL_TZ)
+    return parsed.timestamp()
+
+def encode_cursor(key) -> str:
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+def decode_cursor(cursor: str):
+    try:
+        start_ts, event_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(start_ts), str(event_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@router.get("/events")
+def list_events(response: Response, timeMin: Optional[str] = None, timeMax: Optional[str] = None,
+                limit: int = Query(10, ge=1, le=2500), cursor: Optional[str] = None,
+                calendar: CalendarClients = Depends(clients)):
+    time_min = parse_time_param(timeMin) if timeMin else datetime.datetime.now(datetime.timezone.utc).timestamp()
+    time_max = parse_time_param(timeMax) if timeMax else None
+    after = decode_cursor(cursor) if cursor else None
+    try:
+        calendar.refresh(YOUR_CALENDAR_ID)
+    except Exception as e:
+        # Same as /agenda: answer from the cache and say which calendar may be out of date
+        logger.warning(f"Serving cached events for {YOUR_CALENDAR_ID}, sync failed: {e}")
+        response.headers["X-Stale-Calendars"] = YOUR_CALENDAR_ID
+    try:
+        events, next_key = calendar.event_store.range(YOUR_CALENDAR_ID, time_min, time_max, limit=limit, after=after)
+        return {"events": events, "nextCursor": encode_cursor(next_key) if next_key else None}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching events: {str(e)}")
 
-@app.post("/events")
-def create_event(event: EventCreate):
+def selected_calendars(calendars: Optional[str]) -> List[str]:
+    ids = [calendar_id.strip() for calendar_id in (calendars or "").split(",") if calendar_id.strip()]
+    return ids or [YOUR_CALENDAR_ID]
+
+def refresh_calendars(calendar: CalendarClients, calendar_ids: List[str]):
+    for calendar_id in calendar_ids:
+        calendar.refresh(calendar_id)
+
+def iso(ts: float) -> str:
+    return datetime.datetime.fromtimestamp(ts, LOCAL_TZ).isoformat()
+
+def conflict_details(calendar: CalendarClients, calendar_ids: List[str], start_ts: float, end_ts: float) -> List[dict]:
+    return [
+        {
+            "calendarId": calendar_id,
+            "eventId": event_id,
+            "summary": (calendar.event_store.get(calendar_id, event_id) or {}).get("summary"),
+            "start": iso(busy_start),
+            "end": iso(busy_end),
+        }
+        for calendar_id, busy_start, busy_end, event_id in calendar.availability.conflicts(calendar_ids, start_ts, end_ts)
+    ]
+
+@router.get("/availability")
+def get_availability(timeMin: str, timeMax: str, duration: int = Query(60, ge=1, description="Minutes"),
+                     step: int = Query(30, ge=1, description="Minutes between suggested slots"),
+                     calendars: Optional[str] = None, limit: int = Query(20, ge=1, le=500),
+                     calendar: CalendarClients = Depends(clients)):
+    time_min, time_max = parse_time_param(timeMin), parse_time_param(timeMax)
+    if time_max <= time_min:
+        raise HTTPException(status_code=400, detail="timeMax must be after timeMin")
+    calendar_ids = selected_calendars(calendars)
+    try:
+        refresh_calendars(calendar, calendar_ids)
+        free = calendar.availability.free_periods(calendar_ids, time_min, time_max, duration * 60)
+        slots = calendar.availability.slots(calendar_ids, time_min, time_max, duration * 60, step * 60, limit=limit)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error computing availability: {str(e)}")
+    return {
+        "free": [{"start": iso(start), "end": iso(end)} for start, end in free],
+        "slots": [{"start": iso(start), "end": iso(end)} for start, end in slots],
+    }
+
+@router.get("/conflicts")
+def get_conflicts(start: str, end: str, calendars: Optional[str] = None,
+                  calendar: CalendarClients = Depends(clients)):
+    start_ts, end_ts = parse_time_param(start), parse_time_param(end)
+    if end_ts <= start_ts:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    calendar_ids = selected_calendars(calendars)
+    try:
+        refresh_calendars(calendar, calendar_ids)
+        return {"conflicts": conflict_details(calendar, calendar_ids, start_ts, end_ts)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error checking conflicts: {str(e)}")
+
+@router.get("/agenda")
+async def get_agenda(timeMin: Optional[str] = None, timeMax: Optional[str] = None, calendars: Optional[str] = None,
+                     limit: int = Query(100, ge=1, le=10000), calendar: CalendarClients = Depends(clients)):
+    """Events from several calendars as one time-ordered NDJSON stream.
+
+    Stale calendars sync concurrently, so the wait is the slowest sync rather
+    than their sum. Each calendar is then read lazily in start order and the
+    streams are merged with a heap as the response is written. Calendars
+    that fail to sync are served from cache and named in X-Stale-Calendars.
+    """
+    time_min = parse_time_param(timeMin) if timeMin else datetime.datetime.now(datetime.timezone.utc).timestamp()
+    time_max = parse_time_param(timeMax) if timeMax else None
+    calendar_ids = list(dict.fromkeys(selected_calendars(calendars)))
+
+    loop = asyncio.get_running_loop()
+    results = await asyncio.gather(
+        *(loop.run_in_executor(None, calendar.refresh, calendar_id) for calendar_id in calendar_ids),
+        return_exceptions=True,
+    )
+    stale = []
+    for calendar_id, result in zip(calendar_ids, results):
+        if isinstance(result, Exception):
+            logger.warning(f"Serving cached events for {calendar_id}, sync failed: {result}")
+            stale.append(calendar_id)
+
+    def calendar_stream(calendar_id: str):
+        for start_ts, event_id, event in calendar.event_store.iter_range(calendar_id, time_min, time_max):
+            yield start_ts, calendar_id, event_id, event
+
+    def lines():
+        merged = heapq.merge(*(calendar_stream(calendar_id) for calendar_id in calendar_ids))
+        for _, calendar_id, _, event in islice(merged, limit):
+            yield json.dumps(dict(event, calendarId=calendar_id)) + "\n"
+
+    headers = {"X-Stale-Calendars": ",".join(stale)} if stale else None
+    return StreamingResponse(lines(), media_type="application/x-ndjson", headers=headers)
+
+@router.post("/events")
+def create_event(event: EventCreate, calendar: CalendarClients = Depends(clients)):
     try:
         parsed_start = parser.parse(event.start).isoformat()
         parsed_end = parser.parse(event.end).isoformat()
+        # Reported, not enforced: double-booking is sometimes intended
+        conflicts = conflict_details(calendar, [YOUR_CALENDAR_ID], parse_time_param(event.start), parse_time_param(event.end))
 
         event_body = {
             'summary': event.summary,
@@ -67,50 +237,104 @@ def create_event(event: EventCreate):
             'end': {'dateTime': parsed_end, 'timeZone': TIMEZONE}
         }
 
-        created_event = service.events().insert(
+        created_event = execute(calendar.service.events().insert(
             calendarId=YOUR_CALENDAR_ID, body=event_body
-        ).execute()
+        ))
+        calendar.event_store.upsert(YOUR_CALENDAR_ID, created_event)
 
-        return {"message": "Event created", "link": created_event.get("htmlLink")}
+        return {"message": "Event created", "link": created_event.get("htmlLink"), "conflicts": conflicts}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error creating event: {str(e)}")
 
-@app.put("/events")
-def update_event(event: EventUpdate):
-    try:
-        current = service.events().get(calendarId=YOUR_CALENDAR_ID, eventId=event.event_id).execute()
-
-        updated_event = {
-            'summary': event.summary or current['summary'],
-            'start': {
-                'dateTime': parser.parse(event.start).isoformat() if event.start else current['start']['dateTime'],
-                'timeZone': TIMEZONE
-            },
-            'end': {
-                'dateTime': parser.parse(event.end).isoformat() if event.end else current['end']['dateTime'],
-                'timeZone': TIMEZONE
-            }
-        }
-
-        current.update(updated_event)
-        updated = service.events().update(calendarId=YOUR_CALENDAR_ID, eventId=event.event_id, body=current).execute()
+@router.put("/events")
+def update_event(event: EventUpdate, calendar: CalendarClients = Depends(clients)):
+    changes = {}
+    if event.summary:
+        changes['summary'] = event.summary
+    if event.start:
+        changes['start'] = {'dateTime': parser.parse(event.start).isoformat(), 'timeZone': TIMEZONE}
+    if event.end:
+        changes['end'] = {'dateTime': parser.parse(event.end).isoformat(), 'timeZone': TIMEZONE}
+    if not changes:
+        raise HTTPException(status_code=400, detail="Nothing to update")
 
+    try:
+        updated = calendar.event_store.patch(calendar.service, YOUR_CALENDAR_ID, event.event_id, changes)
         return {"message": "Event updated", "link": updated.get("htmlLink")}
+    except HttpError as e:
+        if e.resp.status == 412:
+            # Our copy is stale; resync so a retry carries the current ETag
+            calendar.event_store.sync(calendar.service, YOUR_CALENDAR_ID, force=True)
+            raise HTTPException(status_code=409, detail="Event was changed elsewhere, reload it and try again")
+        if e.resp.status == 404:
+            raise HTTPException(status_code=404, detail=f"Event {event.event_id} not found")
+        raise HTTPException(status_code=500, detail=f"Error updating event: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error updating event: {str(e)}")
 
-@app.delete("/events/{event_id}")
-def delete_event(event_id: str):
+@router.delete("/events/{event_id}")
+def delete_event(event_id: str, calendar: CalendarClients = Depends(clients)):
     try:
-        service.events().delete(calendarId=YOUR_CALENDAR_ID, eventId=event_id).execute()
+        execute(calendar.service.events().delete(calendarId=YOUR_CALENDAR_ID, eventId=event_id))
+        calendar.event_store.remove(YOUR_CALENDAR_ID, event_id)
         return {"message": f"Event {event_id} deleted successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error deleting event: {str(e)}")
 
-@app.get("/calendars")
-def list_calendars():
+@router.get("/calendars")
+def list_calendars(calendar: CalendarClients = Depends(clients)):
     try:
-        calendars = service.calendarList().list().execute()
+        calendars = execute(calendar.service.calendarList().list())
         return {"calendars": calendars.get('items', [])}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching calendars: {str(e)}")
+
+def create_app(http=None, credentials_file: Optional[str] = None, event_db_path: Optional[str] = None) -> FastAPI:
+    """Build the API. Clients are created in the startup hook, so importing this module does no I/O."""
+    app = FastAPI()
+
+    # ✅ Add CORS middleware
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["http://localhost:5173"],  # Or ["*"] to allow all
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["X-Stale-Calendars"],
+    )
+
+    install_metrics(app)
+    app.include_router(router)
+    app.state.clients = None
+    app.state.startup_error = None
+
+    @app.on_event("startup")
+    async def initialize_clients():
+        try:
+            app.state.clients = await asyncio.get_running_loop().run_in_executor(None, lambda: CalendarClients(
+                credentials_file=credentials_file or os.getenv("GOOGLE_CREDENTIALS_FILE", SERVICE_ACCOUNT_FILE),
+                event_db_path=event_db_path or os.getenv("EVENT_DB_PATH", "events.db"),
+                http=http,
+                sync_interval=float(os.getenv("EVENT_SYNC_INTERVAL", "30")),
+            ))
+        except Exception as e:
+            # Keep the worker up so /health/ready can say why it isn't serving
+            app.state.startup_error = str(e)
+            logger.exception("Failed to initialize Calendar client")
+            return
+        logger.info(f"Calendar client ready {(time.perf_counter() - PROCESS_START) * 1000:.0f}ms after start")
+
+    @app.get("/health/live")
+    async def liveness_check():
+        return {"status": "alive"}
+
+    @app.get("/health/ready")
+    async def readiness_check():
+        if app.state.clients is None:
+            detail = f"Startup failed: {app.state.startup_error}" if app.state.startup_error else "Service is still starting"
+            raise HTTPException(status_code=503, detail=detail)
+        return {"status": "ready"}
+
+    return app
+
+app = create_app()
@@ -0,0 +1,353 @@
+import heapq
+import json
+import logging
+import math
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Iterator, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from googleapiclient.errors import HttpError
+
+from metrics import UPSTREAM_RETRIES, execute
+from recurrence import expand, timestamp
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    calendar_id TEXT NOT NULL,
+    id TEXT NOT NULL,
+    start_ts REAL NOT NULL,
+    end_ts REAL NOT NULL,
+    body TEXT NOT NULL,
+    PRIMARY KEY (calendar_id, id)
+);
+CREATE INDEX IF NOT EXISTS idx_events_start ON events (calendar_id, start_ts, id);
+CREATE TABLE IF NOT EXISTS sync_state (
+    calendar_id TEXT PRIMARY KEY,
+    sync_token TEXT,
+    max_duration REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS recurring (
+    calendar_id TEXT NOT NULL,
+    id TEXT NOT NULL,
+    start_ts REAL NOT NULL,
+    body TEXT NOT NULL,
+    PRIMARY KEY (calendar_id, id)
+);
+CREATE TABLE IF NOT EXISTS overrides (
+    calendar_id TEXT NOT NULL,
+    recurring_event_id TEXT NOT NULL,
+    original_start_ts REAL NOT NULL,
+    PRIMARY KEY (calendar_id, recurring_event_id, original_start_ts)
+);
+"""
+# Expansions of recurring series are memoized over windows aligned to whole days
+WINDOW_ALIGNMENT = 86400.0
+# Version 2 syncs with singleEvents=False; older caches hold server-expanded instances and are resynced
+SCHEMA_VERSION = 2
+
+
+def event_bounds(event: dict, tz: ZoneInfo) -> Tuple[float, float]:
+    """Start and end of an event as epoch seconds. All-day dates are read in `tz`."""
+    return timestamp(event["start"], tz), timestamp(event.get("end", event["start"]), tz)
+
+
+class EventStore:
+    """Local copy of Google Calendar events kept current with syncToken incremental sync.
+
+    Events live in SQLite with an index on (calendar_id, start_ts), so time
+    range queries are index range scans however many events are cached.
+    The first sync of a calendar pages through everything; later syncs send
+    the stored nextSyncToken and only receive what changed. A 410 Gone means
+    the token expired and triggers a full resync of that calendar.
+
+    Recurring series are stored once, as their master event, and expanded
+    locally for the window being read; modified or cancelled instances are
+    kept as overrides of the occurrence they replace. Expanded windows are
+    memoized until the calendar changes.
+    """
+
+    def __init__(self, path: str = "events.db", timezone: str = "UTC", min_interval: float = 30.0,
+                 max_windows: int = 512):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        # One sync lock per calendar, so different calendars can sync concurrently
+        self._sync_locks = defaultdict(threading.Lock)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+            if self._conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+                self._conn.execute("DELETE FROM events")
+                self._conn.execute("DELETE FROM sync_state")
+                self._conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.tz = ZoneInfo(timezone)
+        self.min_interval = min_interval
+        self._last_sync = {}
+        self._versions = {}
+        self.max_windows = max_windows
+        self._windows: "OrderedDict[tuple, List[Tuple[float, float, dict]]]" = OrderedDict()
+
+    def version(self, calendar_id: str) -> int:
+        """Bumped on every change to a calendar, so derived indexes know when to rebuild."""
+        return self._versions.get(calendar_id, 0)
+
+    def _touch(self, calendar_id: str):
+        self._versions[calendar_id] = self._versions.get(calendar_id, 0) + 1
+
+    def is_stale(self, calendar_id: str) -> bool:
+        return time.monotonic() - self._last_sync.get(calendar_id, 0.0) >= self.min_interval
+
+    def sync(self, service, calendar_id: str, force: bool = False):
+        with self._lock:
+            sync_lock = self._sync_locks[calendar_id]
+        with sync_lock:
+            # Another caller may have synced while we waited for the lock
+            if not force and not self.is_stale(calendar_id):
+                return
+            token = self._sync_token(calendar_id)
+            try:
+                self._sync(service, calendar_id, token)
+            except HttpError as e:
+                if token is None or e.resp.status != 410:
+                    raise
+                logger.info(f"Sync token for {calendar_id} expired, running full resync")
+                UPSTREAM_RETRIES.labels("calendar").inc()
+                self._clear(calendar_id)
+                self._sync(service, calendar_id, None)
+            self._last_sync[calendar_id] = time.monotonic()
+
+    def _sync(self, service, calendar_id: str, token: Optional[str]):
+        page_token = None
+        while True:
+            params = {"calendarId": calendar_id, "singleEvents": False, "pageToken": page_token, "maxResults": 2500}
+            if token:
+                params["syncToken"] = token
+            response = execute(service.events().list(**params))
+            self._apply(calendar_id, response.get("items", []))
+            page_token = response.get("nextPageToken")
+            if not page_token:
+                break
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO sync_state (calendar_id, sync_token) VALUES (?, ?) "
+                "ON CONFLICT(calendar_id) DO UPDATE SET sync_token = excluded.sync_token",
+                (calendar_id, response.get("nextSyncToken")),
+            )
+
+    def _apply(self, calendar_id: str, items: List[dict]):
+        removed = [(calendar_id, item["id"]) for item in items if item.get("status") == "cancelled"]
+        rows, masters, overrides, longest = [], [], [], 0.0
+        for item in items:
+            if item.get("recurringEventId") and item.get("originalStartTime"):
+                # A moved or cancelled instance replaces the occurrence the series would generate
+                overrides.append((calendar_id, item["recurringEventId"], timestamp(item["originalStartTime"], self.tz)))
+            if item.get("status") == "cancelled" or "start" not in item:
+                continue
+            start_ts, end_ts = event_bounds(item, self.tz)
+            if item.get("recurrence"):
+                masters.append((calendar_id, item["id"], start_ts, json.dumps(item)))
+                continue
+            longest = max(longest, end_ts - start_ts)
+            rows.append((calendar_id, item["id"], start_ts, end_ts, json.dumps(item)))
+        # An event that gained or lost its recurrence moves between tables; drop its copy in the other one
+        singles = [(calendar_id, row[1]) for row in rows]
+        series = [(calendar_id, row[1]) for row in masters]
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM events WHERE calendar_id = ? AND id = ?", removed + series)
+            self._conn.executemany("DELETE FROM recurring WHERE calendar_id = ? AND id = ?", removed + singles)
+            self._conn.executemany("DELETE FROM overrides WHERE calendar_id = ? AND recurring_event_id = ?", removed + singles)
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO events (calendar_id, id, start_ts, end_ts, body) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO recurring (calendar_id, id, start_ts, body) VALUES (?, ?, ?, ?)", masters,
+            )
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO overrides (calendar_id, recurring_event_id, original_start_ts) VALUES (?, ?, ?)",
+                overrides,
+            )
+            # Range queries widen their index scan by the longest event so overlaps aren't missed
+            self._conn.execute(
+                "INSERT INTO sync_state (calendar_id, max_duration) VALUES (?, ?) "
+                "ON CONFLICT(calendar_id) DO UPDATE SET max_duration = MAX(max_duration, excluded.max_duration)",
+                (calendar_id, longest),
+            )
+            self._touch(calendar_id)
+
+    def upsert(self, calendar_id: str, event: dict):
+        """Record an event returned by a write so reads see it before the next sync."""
+        self._apply(calendar_id, [event])
+
+    def patch(self, service, calendar_id: str, event_id: str, changes: dict) -> dict:
+        """Send only `changes` in one events.patch and cache the returned event.
+
+        The cached ETag goes out as If-Match, so an event edited elsewhere
+        since the last sync fails with 412 instead of being overwritten.
+        """
+        request = service.events().patch(calendarId=calendar_id, eventId=event_id, body=changes)
+        cached = self.get(calendar_id, event_id)
+        # get() falls back to the series master for generated instances, whose ETag doesn't apply
+        if cached and cached.get("id") == event_id and cached.get("etag"):
+            request.headers["If-Match"] = cached["etag"]
+        updated = execute(request)
+        self.upsert(calendar_id, updated)
+        return updated
+
+    def remove(self, calendar_id: str, event_id: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM events WHERE calendar_id = ? AND id = ?", (calendar_id, event_id))
+            self._conn.execute("DELETE FROM recurring WHERE calendar_id = ? AND id = ?", (calendar_id, event_id))
+            self._conn.execute("DELETE FROM overrides WHERE calendar_id = ? AND recurring_event_id = ?", (calendar_id, event_id))
+            self._touch(calendar_id)
+
+    def get(self, calendar_id: str, event_id: str) -> Optional[dict]:
+        """A stored event or series master. Generated instance ids resolve to their master."""
+        master_id = event_id.rsplit("_", 1)[0]
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT body FROM events WHERE calendar_id = ? AND id = ?", (calendar_id, event_id),
+            ).fetchone() or self._conn.execute(
+                "SELECT body FROM recurring WHERE calendar_id = ? AND id IN (?, ?) ORDER BY id = ? DESC",
+                (calendar_id, event_id, master_id, event_id),
+            ).fetchone()
+        return json.loads(row["body"]) if row else None
+
+    def _sync_token(self, calendar_id: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT sync_token FROM sync_state WHERE calendar_id = ?", (calendar_id,)).fetchone()
+        return row["sync_token"] if row else None
+
+    def _clear(self, calendar_id: str):
+        with self._lock, self._conn:
+            for table in ("events", "recurring", "overrides", "sync_state"):
+                self._conn.execute(f"DELETE FROM {table} WHERE calendar_id = ?", (calendar_id,))
+            self._touch(calendar_id)
+
+    def busy_intervals(self, calendar_id: str) -> List[Tuple[float, float, str]]:
+        """(start_ts, end_ts, id) for every event that blocks time, i.e. isn't marked transparent."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT start_ts, end_ts, id FROM events WHERE calendar_id = ? "
+                "AND COALESCE(json_extract(body, '$.transparency'), 'opaque') != 'transparent'",
+                (calendar_id,),
+            ).fetchall()
+        return [tuple(row) for row in rows]
+
+    def recurring_intervals(self, calendar_id: str, start: float, end: float) -> List[Tuple[float, float, str]]:
+        """(start_ts, end_ts, id) for blocking occurrences of recurring series overlapping [start, end)."""
+        return [
+            (start_ts, end_ts, instance["id"])
+            for start_ts, end_ts, instance in self.occurrences(calendar_id, start, end)
+            if instance.get("transparency") != "transparent"
+        ]
+
+    def occurrences(self, calendar_id: str, time_min: float, time_max: Optional[float] = None,
+                    count: int = 10, after: Optional[Tuple[float, str]] = None) -> List[Tuple[float, float, dict]]:
+        """Generated occurrences overlapping [time_min, time_max), ordered by (start, id).
+
+        Without time_max, the first `count` of each series (after the
+        `after` key, if given) are returned. Overridden occurrences are left
+        out; their replacements are ordinary rows in the events table.
+        """
+        with self._lock:
+            masters = self._conn.execute(
+                "SELECT id, body FROM recurring WHERE calendar_id = ? AND start_ts < ?",
+                (calendar_id, float("inf") if time_max is None else time_max),
+            ).fetchall()
+            overridden = {tuple(row) for row in self._conn.execute(
+                "SELECT recurring_event_id, original_start_ts FROM overrides WHERE calendar_id = ?", (calendar_id,),
+            )}
+        found = []
+        for row in masters:
+            master = json.loads(row["body"])
+            first_start, first_end = event_bounds(master, self.tz)
+            duration = first_end - first_start
+            lower = max(time_min - duration, after[0]) if after else time_min - duration
+            for occurrence in self._window(calendar_id, master, lower, time_max, count):
+                start_ts, end_ts, instance = occurrence
+                if end_ts <= time_min or (row["id"], start_ts) in overridden:
+                    continue
+                if after is not None and (start_ts, instance["id"]) <= after:
+                    continue
+                found.append(occurrence)
+        return sorted(found, key=lambda occurrence: (occurrence[0], occurrence[2]["id"]))
+
+    def _window(self, calendar_id: str, master: dict, after: float, before: Optional[float], count: int):
+        """Occurrences starting in [after, before), or at least count + 1 from `after` when unbounded.
+
+        Bounds move with the clock and with page cursors, so expansions are
+        memoized over whole days and trimmed to the requested bounds.
+        """
+        floor = math.floor(after / WINDOW_ALIGNMENT) * WINDOW_ALIGNMENT
+        if before is not None:
+            ceil = math.ceil(before / WINDOW_ALIGNMENT) * WINDOW_ALIGNMENT
+            return [item for item in self._expansion(calendar_id, master, floor, ceil, None) if after <= item[0] < before]
+        # One spare occurrence covers ones the caller filters out; widen if the days before `after` used them up
+        wanted = count + 1
+        while True:
+            expanded = self._expansion(calendar_id, master, floor, None, wanted)
+            found = [item for item in expanded if item[0] >= after]
+            if len(found) > count or len(expanded) < wanted:
+                return found
+            wanted *= 2
+
+    def _expansion(self, calendar_id: str, master: dict, after: float, before: Optional[float], count: Optional[int]):
+        key = (calendar_id, self.version(calendar_id), master["id"], after, before, count)
+        with self._lock:
+            cached = self._windows.get(key)
+            if cached is not None:
+                self._windows.move_to_end(key)
+                return cached
+        expanded = expand(master, self.tz, after, before, count=count)
+        with self._lock:
+            self._windows[key] = expanded
+            while len(self._windows) > self.max_windows:
+                self._windows.popitem(last=False)
+        return expanded
+
+    def range(self, calendar_id: str, time_min: float, time_max: Optional[float] = None, limit: int = 10,
+              after: Optional[Tuple[float, str]] = None) -> Tuple[List[dict], Optional[Tuple[float, str]]]:
+        """Events overlapping [time_min, time_max), ordered by start, with keyset pagination.
+
+        Returns the page and the key to pass as `after` for the next page, or
+        None when this is the last page.
+        """
+        with self._lock:
+            state = self._conn.execute("SELECT max_duration FROM sync_state WHERE calendar_id = ?", (calendar_id,)).fetchone()
+            max_duration = state["max_duration"] if state else 0.0
+            query = "SELECT id, start_ts, body FROM events WHERE calendar_id = ? AND start_ts >= ? AND end_ts > ?"
+            params: list = [calendar_id, time_min - max_duration, time_min]
+            if time_max is not None:
+                query += " AND start_ts < ?"
+                params.append(time_max)
+            if after is not None:
+                query += " AND (start_ts > ? OR (start_ts = ? AND id > ?))"
+                params += [after[0], after[0], after[1]]
+            query += " ORDER BY start_ts, id LIMIT ?"
+            params.append(limit + 1)
+            rows = self._conn.execute(query, params).fetchall()
+        stored = [(row["start_ts"], row["id"], json.loads(row["body"])) for row in rows]
+        generated = [
+            (start_ts, instance["id"], instance)
+            for start_ts, _, instance in self.occurrences(calendar_id, time_min, time_max, limit + 1, after)
+        ]
+        page = list(heapq.merge(stored, generated, key=lambda item: item[:2]))[:limit + 1]
+        next_key = page[limit - 1][:2] if len(page) > limit else None
+        return [event for _, _, event in page[:limit]], next_key
+
+    def iter_range(self, calendar_id: str, time_min: float, time_max: Optional[float] = None,
+                   page_size: int = 100) -> Iterator[Tuple[float, str, dict]]:
+        """(start_ts, id, event) for events overlapping the window, in order, read lazily page by page."""
+        after = None
+        while True:
+            events, after = self.range(calendar_id, time_min, time_max, limit=page_size, after=after)
+            for event in events:
+                yield event_bounds(event, self.tz)[0], event["id"], event
+            if after is None:
+                return
@@ -1,22 +1,32 @@
 from __future__ import print_function
 import datetime
 import os.path
+from functools import lru_cache
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 from dateutil import parser
+from event_store import EventStore
 
 # Define the scope and credentials file
 SCOPES = ['https://www.googleapis.com/auth/calendar']
 SERVICE_ACCOUNT_FILE = 'credentials.json'  # Path to your JSON key file
 
-# Authenticate and build the service
-creds = service_account.Credentials.from_service_account_file(
-    SERVICE_ACCOUNT_FILE, scopes=SCOPES)
-service = build('calendar', 'v3', credentials=creds)
-
 # Define your local timezone
 TIMEZONE = 'Asia/Kolkata'
 
+@lru_cache(maxsize=None)
+def get_service():
+    """Authenticate and build the service on first use, not at import."""
+    creds = service_account.Credentials.from_service_account_file(
+        SERVICE_ACCOUNT_FILE, scopes=SCOPES)
+    return build('calendar', 'v3', credentials=creds)
+
+@lru_cache(maxsize=None)
+def get_event_store():
+    # Shares the local event cache with the API server; only changes are fetched after the first run
+    return EventStore('events.db', timezone=TIMEZONE, min_interval=0)
+
 # Replace with your actual calendar email address from the screenshot
 # e.g. 'padgelwartrisha91@gmail.com'
 YOUR_CALENDAR_ID = 'padgelwartrisha91@gmail.com'  # Update this!
@@ -24,7 +34,7 @@ YOUR_CALENDAR_ID = 'padgelwartrisha91@gmail.com'  # Update this!
 def list_calendars():
     """Lists available calendars."""
     try:
-        calendars = service.calendarList().list().execute()
+        calendars = get_service().calendarList().list().execute()
         print("\n📅 Available Calendars:")
         for cal in calendars.get('items', []):
             print(f"{cal['id']} - {cal['summary']}")
@@ -40,12 +50,10 @@ def list_events(calendar_id=None):
         calendar_id = YOUR_CALENDAR_ID
         
     try:
-        now = datetime.datetime.utcnow().isoformat() + 'Z'
+        now = datetime.datetime.now(datetime.timezone.utc).timestamp()
         print(f"Fetching events from calendar: {calendar_id}")
-        events_result = service.events().list(calendarId=calendar_id, timeMin=now,
-                                              maxResults=10, singleEvents=True,
-                                              orderBy='startTime').execute()
-        events = events_result.get('items', [])
+        get_event_store().sync(get_service(), calendar_id)
+        events, _ = get_event_store().range(calendar_id, now, limit=10)
         
         if not events:
             print('No upcoming events found.')
@@ -87,7 +95,7 @@ def create_event():
     }
     
     try:
-        created_event = service.events().insert(calendarId=YOUR_CALENDAR_ID, body=event).execute()
+        created_event = get_service().events().insert(calendarId=YOUR_CALENDAR_ID, body=event).execute()
         print(f"✅ Event created: {created_event.get('htmlLink')}")
     except Exception as e:
         print(f"❌ Error creating event: {e}")
@@ -101,7 +109,7 @@ def delete_event():
     event_id = input("Enter Event ID to delete: ")
     
     try:
-        service.events().delete(calendarId=YOUR_CALENDAR_ID, eventId=event_id).execute()
+        get_service().events().delete(calendarId=YOUR_CALENDAR_ID, eventId=event_id).execute()
         print(f"✅ Event {event_id} deleted successfully.")
     except Exception as e:
         print(f"❌ Error deleting event: {e}")
@@ -114,17 +122,33 @@ def update_event():
 
     event_id = input("Enter Event ID to update: ")
     
-    try:
-        event = service.events().get(calendarId=YOUR_CALENDAR_ID, eventId=event_id).execute()
-        
-        summary = input(f"Enter new title (or press enter to keep '{event.get('summary')}'): ") or event.get('summary')
-        start_time = parse_datetime(input("Enter new start time (or press enter to keep old): ")) or event['start']['dateTime']
-        end_time = parse_datetime(input("Enter new end time (or press enter to keep old): ")) or event['end']['dateTime']
-
-        event.update({'summary': summary, 'start': {'dateTime': start_time, 'timeZone': TIMEZONE}, 'end': {'dateTime': end_time, 'timeZone': TIMEZONE}})
+    event = next((item for item in events if item['id'] == event_id), None) or get_event_store().get(YOUR_CALENDAR_ID, event_id) or {}
+
+    changes = {}
+    summary = input(f"Enter new title (or press enter to keep '{event.get('summary')}'): ")
+    if summary:
+        changes['summary'] = summary
+    start_input = input("Enter new start time (or press enter to keep old): ")
+    start_time = parse_datetime(start_input) if start_input else None
+    if start_time:
+        changes['start'] = {'dateTime': start_time, 'timeZone': TIMEZONE}
+    end_input = input("Enter new end time (or press enter to keep old): ")
+    end_time = parse_datetime(end_input) if end_input else None
+    if end_time:
+        changes['end'] = {'dateTime': end_time, 'timeZone': TIMEZONE}
+
+    if not changes:
+        print("Nothing to update.")
+        return
 
-        updated_event = service.events().update(calendarId=YOUR_CALENDAR_ID, eventId=event_id, body=event).execute()
+    try:
+        updated_event = get_event_store().patch(get_service(), YOUR_CALENDAR_ID, event_id, changes)
         print(f"✅ Event updated: {updated_event.get('htmlLink')}")
+    except HttpError as e:
+        if e.resp.status == 412:
+            print("❌ Event was changed elsewhere since it was listed. List events again and retry.")
+        else:
+            print(f"❌ Error updating event: {e}")
     except Exception as e:
         print(f"❌ Error updating event: {e}")
 
@@ -0,0 +1,81 @@
+"""Prometheus metrics for the calendar backend.
+
+`execute`, `RequestTimer` and `install` are the same as in
+email-bot-backend/metrics.py, which is the copy to change first. The two
+backends are deployed and started from their own directories with no
+shared package between them, so each carries its own; keep them in step.
+"""
+import time
+
+from fastapi import FastAPI
+from fastapi.responses import Response
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Histogram, generate_latest
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "Time to produce a response, by route template.",
+    ("method", "route", "status"), buckets=DEFAULT_BUCKETS,
+)
+UPSTREAM_LATENCY = Histogram(
+    "upstream_call_duration_seconds", "Latency of Google API calls, by API method.",
+    ("method", "outcome"), buckets=DEFAULT_BUCKETS,
+)
+UPSTREAM_RETRIES = Counter("upstream_retries_total", "Retried Google API calls.", ("api",))
+CACHE_REQUESTS = Counter("cache_requests_total", "Lookups against local caches.", ("cache", "result"))
+
+
+def execute(request, method: str = None, http=None):
+    """Execute a googleapiclient request (on `http` if given) and record its latency."""
+    method = method or getattr(request, "methodId", None) or "batch"
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        response = request.execute(http=http)
+        outcome = "ok"
+        return response
+    finally:
+        UPSTREAM_LATENCY.labels(method, outcome).observe(time.perf_counter() - started)
+
+
+class RequestTimer:
+    """Plain ASGI middleware timing each request until its response headers go out."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        observed = False
+
+        def observe(status):
+            nonlocal observed
+            observed = True
+            # The router fills in scope["route"]; templates keep label cardinality bounded (no raw ids)
+            route = scope.get("route")
+            REQUEST_LATENCY.labels(
+                scope["method"], getattr(route, "path", "unmatched"), status,
+            ).observe(time.perf_counter() - started)
+
+        async def timed_send(message):
+            if message["type"] == "http.response.start":
+                observe(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, timed_send)
+        finally:
+            if not observed:
+                observe(500)
+
+
+def install(app: FastAPI, registry=REGISTRY):
+    """Time every request by route template and serve the registry on /metrics."""
+    app.add_middleware(RequestTimer)
+
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
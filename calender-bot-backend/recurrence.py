@@ -0,0 +1,76 @@
+import logging
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from dateutil import parser
+from dateutil.rrule import rrulestr
+
+logger = logging.getLogger(__name__)
+
+
+def timestamp(value: dict, tz: ZoneInfo) -> float:
+    """Epoch seconds for a Calendar start/end/originalStartTime. All-day dates are read in `tz`."""
+    if "dateTime" in value:
+        parsed = parser.isoparse(value["dateTime"])
+    else:
+        parsed = datetime.fromisoformat(value["date"])
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=tz)
+    return parsed.timestamp()
+
+
+def expand(master: dict, tz: ZoneInfo, after: float, before: Optional[float] = None,
+           count: Optional[int] = None) -> List[Tuple[float, float, dict]]:
+    """Occurrences of a recurring master starting in [after, before), as (start_ts, end_ts, instance).
+
+    Rules are evaluated in the event's own time zone so occurrences keep
+    their wall-clock time across DST changes. Without `before`, at most
+    `count` occurrences are returned. Instances look like the ones Google
+    returns for singleEvents=True: same id scheme, recurringEventId and
+    originalStartTime.
+    """
+    start, end = master["start"], master.get("end", master["start"])
+    all_day = "dateTime" not in start
+    if all_day:
+        dtstart = datetime.fromisoformat(start["date"])
+        event_tz = tz
+    else:
+        event_tz = ZoneInfo(start["timeZone"]) if start.get("timeZone") else tz
+        dtstart = parser.isoparse(start["dateTime"]).astimezone(event_tz)
+    duration = timestamp(end, tz) - timestamp(start, tz)
+
+    def to_local(ts: float) -> datetime:
+        moment = datetime.fromtimestamp(ts, event_tz)
+        return moment.replace(tzinfo=None) if all_day else moment
+
+    try:
+        rules = rrulestr("\n".join(master.get("recurrence", [])), dtstart=dtstart, forceset=True)
+        if before is not None:
+            found = rules.between(to_local(after), to_local(before), inc=True)
+            found = [moment for moment in found if moment < to_local(before)]
+        else:
+            found = list(rules.xafter(to_local(after), count=count, inc=True))
+    except (ValueError, TypeError) as e:
+        logger.warning(f"Could not expand recurrence of {master.get('id')}: {e}")
+        return []
+
+    occurrences = []
+    for moment in found:
+        if all_day:
+            start_ts = moment.replace(tzinfo=tz).timestamp()
+            original = {"date": moment.date().isoformat()}
+            suffix = moment.strftime("%Y%m%d")
+            bounds = {"start": original, "end": {"date": datetime.fromtimestamp(start_ts + duration, tz).date().isoformat()}}
+        else:
+            start_ts = moment.timestamp()
+            original = {"dateTime": moment.isoformat(), "timeZone": start.get("timeZone")}
+            suffix = moment.astimezone(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+            bounds = {
+                "start": original,
+                "end": {"dateTime": datetime.fromtimestamp(start_ts + duration, event_tz).isoformat(), "timeZone": end.get("timeZone")},
+            }
+        instance = {key: value for key, value in master.items() if key not in ("recurrence", "start", "end")}
+        instance.update(bounds, id=f"{master['id']}_{suffix}", recurringEventId=master["id"], originalStartTime=original)
+        occurrences.append((start_ts, start_ts + duration, instance))
+    return occurrences
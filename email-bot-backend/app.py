@@ -1,25 +1,38 @@
+# Taken before the heavy imports so the reported startup time includes them
+import time
+PROCESS_START = time.perf_counter()
+
 import os
 import base64
+import gzip
+import hashlib
 import json
 import logging
-import re
 from datetime import datetime, timedelta
 from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
+import httplib2
+from google_auth_httplib2 import Request as AuthRequest
 from googleapiclient.errors import HttpError
-from email.mime.text import MIMEText
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException, status
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, HTTPException, Header, Depends, Query, Request, status
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import Optional, List, Tuple
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
 import httpx
-import time
-import re
-import dateparser
-from dateparser.search import search_dates
+import asyncio
+import orjson
+from context_retriever import ContextRetriever
+from date_extractor import extract_dates, parse_date, parse_time
+from google_executor import GoogleExecutor
+from health_prober import HealthProber
+from inbox_poller import InboxPoller
+from llm_client import CompletionClient, email_prompt
+from mailbox_store import MailboxStore, MailboxSync
+from metrics import CACHE_REQUESTS, Histogram, LruCacheCollector, REGISTRY, install as install_metrics
+from micro_batcher import MicroBatcher
+from outbox import Outbox, OutboxFull
+from upstream_scheduler import GMAIL_QUOTA_UNITS, RetryBudget, TokenBucket, UpstreamScheduler, is_rate_limited
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -48,6 +61,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+install_metrics(app)
+
+STAGE_LATENCY = Histogram("stage_duration_seconds", "Time spent in local processing stages.", ("stage",))
+
+REGISTRY.register(LruCacheCollector({"date_parse": parse_date, "time_parse": parse_time}))
+
 # Models
 class EmailRequest(BaseModel):
     to: str
@@ -61,6 +80,9 @@ class GenerateEmailRequest(BaseModel):
 class MarkAsReadRequest(BaseModel):
     message_id: str
 
+class BulkMarkAsReadRequest(BaseModel):
+    message_ids: List[str]
+
 class CreateEventRequest(BaseModel):
     summary: str
     description: Optional[str] = None
@@ -68,71 +90,97 @@ class CreateEventRequest(BaseModel):
     end_datetime: str
     attendees: Optional[List[str]] = None
 
+class BulkEventItem(CreateEventRequest):
+    idempotency_key: str
+
+class CreateEventsRequest(BaseModel):
+    events: List[BulkEventItem]
+
 class ExtractDateRequest(BaseModel):
     snippet: str
 
+class ExtractDatesBatchRequest(BaseModel):
+    snippets: List[str]
+
 # Services
-gmail_service = None
-calendar_service = None
+SCOPES = [
+    "https://www.googleapis.com/auth/gmail.send",
+    "https://www.googleapis.com/auth/gmail.readonly",
+    "https://www.googleapis.com/auth/gmail.modify",
+    "https://www.googleapis.com/auth/calendar"
+]
 
-def get_services() -> Tuple:
-    global gmail_service, calendar_service
-    if gmail_service and calendar_service:
-        return gmail_service, calendar_service
+def load_credentials() -> Credentials:
     try:
         token_path = "token.json"
         if not os.path.exists(token_path):
             logger.error(f"Token file not found at {token_path}")
             raise FileNotFoundError(f"Authentication token file not found: {token_path}")
-        creds = Credentials.from_authorized_user_file(
-            token_path,
-            scopes=[
-                "https://www.googleapis.com/auth/gmail.send",
-                "https://www.googleapis.com/auth/gmail.readonly",
-                "https://www.googleapis.com/auth/gmail.modify",
-                "https://www.googleapis.com/auth/calendar"
-            ]
-        )
-        gmail_service = build("gmail", "v1", credentials=creds, static_discovery=False)
-        calendar_service = build("calendar", "v3", credentials=creds, static_discovery=False)
-        logger.info("Gmail and Calendar API services initialized successfully")
-        return gmail_service, calendar_service
+        creds = Credentials.from_authorized_user_file(token_path, scopes=SCOPES)
+        if not creds.valid:
+            if not (creds.expired and creds.refresh_token):
+                raise ValueError("Token is invalid and cannot be refreshed; re-run gmail_auth.py")
+            creds.refresh(AuthRequest(httplib2.Http(timeout=20)))
+        return creds
     except Exception as e:
         logger.error(f"Failed to initialize services: {e}")
         raise RuntimeError(f"Service initialization failed: {e}")
 
-# Improved date extractor
+google = GoogleExecutor(
+    load_credentials,
+    max_workers=int(os.getenv("GOOGLE_API_WORKERS", "32")),
+    default_timeout=float(os.getenv("GOOGLE_API_TIMEOUT", "30")),
+    discovery_cache_dir=os.getenv("GOOGLE_DISCOVERY_CACHE", "discovery_cache"),
+)
 
-def extract_dates(text: str) -> List[str]:
-    combined_text = ' '.join(text.splitlines())
+scheduler = UpstreamScheduler(
+    buckets={
+        # Gmail allows 250 quota units per user per second
+        "gmail": TokenBucket(
+            rate=float(os.getenv("GMAIL_QUOTA_UNITS_PER_SECOND", "250")),
+            capacity=float(os.getenv("GMAIL_QUOTA_BURST_UNITS", "250")),
+        ),
+        "calendar": TokenBucket(
+            rate=float(os.getenv("CALENDAR_REQUESTS_PER_SECOND", "10")),
+            capacity=float(os.getenv("CALENDAR_REQUESTS_BURST", "20")),
+        ),
+    },
+    retry_budget=RetryBudget(ratio=float(os.getenv("UPSTREAM_RETRY_RATIO", "0.1"))),
+    batch_concurrency=int(os.getenv("GOOGLE_BATCH_CONCURRENCY", "4")),
+    http_factory=google.new_http,
+)
 
-    # Match date like: April 10th, 2025
-    date_pattern = r'((?:\d{1,2}(?:st|nd|rd|th)?\s+)?(?:January|February|March|April|May|June|July|August|September|October|November|December)\s+\d{1,2}(?:st|nd|rd|th)?(?:,?\s*\d{4})?)'
+@app.on_event("startup")
+async def initialize_google_clients():
+    # Fail startup rather than the first request if credentials are unusable
+    await asyncio.get_running_loop().run_in_executor(None, google.warm_up)
+    app.state.ready = True
+    logger.info(f"Google API clients ready {(time.perf_counter() - PROCESS_START) * 1000:.0f}ms after start")
 
-    # Match time like: 3:00 PM or 3 PM
-    time_pattern = r'(\d{1,2}(?::\d{2})?\s*(?:AM|PM|am|pm))'
+def request_timeout(x_request_timeout: Optional[float] = Header(None)) -> Optional[float]:
+    """Per-request deadline in seconds, taken from the X-Request-Timeout header."""
+    if x_request_timeout is not None and x_request_timeout <= 0:
+        raise HTTPException(status_code=400, detail="X-Request-Timeout must be positive.")
+    return x_request_timeout
 
-    date_match = re.search(date_pattern, combined_text, re.IGNORECASE)
-    time_match = re.search(time_pattern, combined_text, re.IGNORECASE)
+UPSTREAM_TIMEOUT_DETAIL = "Timed out waiting for Google API"
 
-    if date_match:
-        date_str = date_match.group()
-        parsed_date = dateparser.parse(date_str, settings={'PREFER_DATES_FROM': 'future'})
-        if not parsed_date:
-            return []
+def sse_event(data: dict, event: Optional[str] = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
 
-        if time_match:
-            time_str = time_match.group()
-            parsed_time = dateparser.parse(time_str)
-            if parsed_time:
-                combined = parsed_date.replace(hour=parsed_time.hour, minute=parsed_time.minute)
-                return [combined.isoformat()]
-        
-        # Only date
-        return [parsed_date.isoformat()]
-    
-    return []
 
+llm = CompletionClient(
+    TOGETHER_API_KEY,
+    base_url=os.getenv("TOGETHER_API_BASE", "https://api.together.xyz/v1"),
+    max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+)
+
+@app.on_event("shutdown")
+async def shutdown_clients():
+    google.shutdown()
+    scheduler.shutdown()
+    await llm.aclose()
 
 @app.post("/extract-dates")
 def extract_dates_from_email(request: ExtractDateRequest):
@@ -141,73 +189,308 @@ def extract_dates_from_email(request: ExtractDateRequest):
     extracted_dates = extract_dates(request.snippet)
     return {"dates": extracted_dates}
 
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(min=4, max=10), retry=retry_if_exception_type((HttpError, TimeoutError)))
-def fetch_unread_messages(service) -> dict:
-    return service.users().messages().list(userId="me", q="is:unread", maxResults=5, fields="messages(id),nextPageToken").execute()
+MAX_BATCH_SNIPPETS = 1000
+
+@app.post("/extract-dates/batch")
+def extract_dates_batch(request: ExtractDatesBatchRequest):
+    if len(request.snippets) > MAX_BATCH_SNIPPETS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_SNIPPETS} snippets per request.")
+    return {"dates": [extract_dates(snippet) if snippet else [] for snippet in request.snippets]}
+
+# Gmail rejects batches larger than 100 calls and starts throttling well before that
+BATCH_SIZE = 50
+
+def get_message_details_batch(service, message_ids: List[str],
+                              scheduler: UpstreamScheduler = scheduler) -> Tuple[dict, dict]:
+    """Fetch metadata for many messages using Gmail batch HTTP requests."""
+    # Building a discovery resource costs milliseconds of CPU; make it once, not once per message
+    messages = service.users().messages()
+    return scheduler.execute_batch(
+        service, message_ids,
+        lambda message_id: messages.get(userId="me", id=message_id, format="metadata", metadataHeaders=["From", "Subject", "Date"]),
+        api="gmail",
+        cost_per_request=GMAIL_QUOTA_UNITS["gmail.users.messages.get"],
+        batch_size=BATCH_SIZE,
+    )
+
+def build_email_info(message_id: str, email_data: dict) -> dict:
+    headers = {header["name"].lower(): header["value"] for header in email_data.get("payload", {}).get("headers", [])}
+    snippet = email_data.get("snippet", "")
+    started = time.perf_counter()
+    potential_dates = extract_dates(snippet)
+    STAGE_LATENCY.labels("extract_dates").observe(time.perf_counter() - started)
+    return {
+        "id": message_id,
+        "from": headers.get("from", "Unknown Sender"),
+        "subject": headers.get("subject", "No Subject"),
+        "date": headers.get("date", "Unknown Date"),
+        "snippet": snippet,
+        "potentialDates": potential_dates
+    }
+
+mailbox = MailboxSync(
+    MailboxStore(os.getenv("MAILBOX_DB_PATH", "mailbox.db")),
+    fetch_details=get_message_details_batch,
+    build_info=build_email_info,
+    execute=scheduler.execute,
+    min_interval=float(os.getenv("MAILBOX_SYNC_INTERVAL", "15")),
+)
+
+context_retriever = ContextRetriever(
+    scheduler,
+    token_budget=int(os.getenv("CONTEXT_TOKEN_BUDGET", "1000")),
+    store=mailbox.store,
+    build_info=build_email_info,
+)
+
+poller = InboxPoller(
+    mailbox,
+    run_sync=lambda: google.run(lambda gmail, _: mailbox.sync(gmail)),
+    interval=mailbox.min_interval,
+)
+
+@app.on_event("startup")
+async def start_inbox_poller():
+    # Opened here rather than at import, so importing the module creates no files
+    mailbox.store.open()
+    poller.start()
+
+@app.on_event("shutdown")
+async def stop_inbox_poller():
+    await poller.stop()
+
+EMAIL_FIELDS = ("id", "from", "subject", "date", "snippet", "potentialDates")
+# Pages smaller than this aren't worth the CPU to compress
+GZIP_MIN_BYTES = 4096
 
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(min=2, max=5), retry=retry_if_exception_type((HttpError, TimeoutError)))
-def get_message_details(service, message_id: str) -> dict:
-    return service.users().messages().get(userId="me", id=message_id, format="metadata", metadataHeaders=["From", "Subject", "Date"]).execute()
+def encode_cursor(key: Tuple[int, str]) -> str:
+    return base64.urlsafe_b64encode(f"{key[0]}:{key[1]}".encode("utf-8")).decode("ascii")
 
-@app.get("/unread-emails", response_model=dict)
-async def get_unread_emails():
+def decode_cursor(cursor: str) -> Tuple[int, str]:
     try:
-        gmail, _ = get_services()
-        response = fetch_unread_messages(gmail)
-        messages = response.get("messages", [])
-        if not messages:
-            return {"emails": []}
-        unread_emails = []
-        for msg in messages:
-            try:
-                email_data = get_message_details(gmail, msg["id"])
-                headers = {header["name"].lower(): header["value"] for header in email_data.get("payload", {}).get("headers", [])}
-                snippet = email_data.get("snippet", "")
-                email_info = {
-                    "id": msg["id"],
-                    "from": headers.get("from", "Unknown Sender"),
-                    "subject": headers.get("subject", "No Subject"),
-                    "date": headers.get("date", "Unknown Date"),
-                    "snippet": snippet,
-                    "potentialDates": extract_dates(snippet)
-                }
-                unread_emails.append(email_info)
-            except Exception as e:
-                logger.warning(f"Skipping message {msg['id']} due to error: {str(e)}")
-        return {"emails": unread_emails}
+        internal_date, message_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split(":", 1)
+        return int(internal_date), message_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    if not fields:
+        return None
+    selected = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in selected if field not in EMAIL_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return selected
+
+def json_response(request: Request, payload: dict) -> Response:
+    """Serialize with orjson and gzip large bodies for clients that accept it."""
+    body = orjson.dumps(payload)
+    if len(body) >= GZIP_MIN_BYTES and "gzip" in request.headers.get("accept-encoding", ""):
+        return Response(
+            gzip.compress(body, compresslevel=5),
+            media_type="application/json",
+            headers={"Content-Encoding": "gzip", "Vary": "Accept-Encoding"},
+        )
+    return Response(body, media_type="application/json", headers={"Vary": "Accept-Encoding"})
+
+@app.get("/unread-emails")
+async def get_unread_emails(
+    request: Request,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    timeout: Optional[float] = Depends(request_timeout),
+):
+    after = decode_cursor(cursor) if cursor else None
+    selected = parse_fields(fields)
+    stale = False
+    # Later pages come from the same cached snapshot; only the first page triggers a sync
+    if after is None and mailbox.is_stale():
+        CACHE_REQUESTS.labels("mailbox", "miss").inc()
+        try:
+            await asyncio.wait_for(poller.refresh(), timeout or google.default_timeout)
+        except Exception as e:
+            # Like the stream: serve the last synced view, flagged stale, rather than an error
+            if mailbox.store.get_state("history_id") is None:
+                if isinstance(e, asyncio.TimeoutError):
+                    raise HTTPException(status_code=504, detail=UPSTREAM_TIMEOUT_DETAIL)
+                logger.error(f"Error fetching unread emails: {e}")
+                raise HTTPException(status_code=500, detail=str(e))
+            logger.warning(f"Inbox sync failed, serving cached unread emails: {e!r}")
+            stale = True
+    else:
+        CACHE_REQUESTS.labels("mailbox", "hit").inc()
+    try:
+        emails, next_key = mailbox.store.unread_page(limit, after)
     except Exception as e:
         logger.error(f"Error fetching unread emails: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+    if selected:
+        emails = [{field: email[field] for field in selected} for email in emails]
+    return json_response(request, {
+        "emails": emails,
+        "nextCursor": encode_cursor(next_key) if next_key else None,
+        "failed": mailbox.pending(),
+        "stale": stale,
+    })
+
+STREAM_KEEPALIVE_SECONDS = 15
+
+@app.get("/unread-emails/stream")
+async def stream_unread_emails(request: Request):
+    """Push the unread view as a snapshot followed by {new, read, removed} diffs."""
+    queue = poller.subscribe()
+
+    async def events():
+        try:
+            try:
+                emails = await poller.refresh() if mailbox.is_stale() else mailbox.store.unread()
+            except Exception as e:
+                logger.warning(f"Inbox refresh for new subscriber failed: {e}")
+                emails = mailbox.store.unread()
+            yield sse_event({"emails": emails}, event="snapshot")
+            while not await request.is_disconnected():
+                try:
+                    diff = await asyncio.wait_for(queue.get(), STREAM_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if diff is None:
+                    break
+                yield sse_event(diff, event="diff")
+        finally:
+            poller.unsubscribe(queue)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+# users.messages.batchModify accepts at most 1000 ids per call
+BATCH_MODIFY_LIMIT = 1000
+
+def mark_messages_read(gmail, message_ids: List[str]):
+    for start in range(0, len(message_ids), BATCH_MODIFY_LIMIT):
+        request = gmail.users().messages().batchModify(
+            userId="me",
+            body={"ids": message_ids[start:start + BATCH_MODIFY_LIMIT], "removeLabelIds": ["UNREAD"]},
+        )
+        scheduler.execute(request)
+    for message_id in message_ids:
+        mailbox.store.update_labels(message_id, removed=["UNREAD"])
+
+mark_read_batcher = MicroBatcher(
+    lambda message_ids: google.run(lambda gmail, _: mark_messages_read(gmail, message_ids)),
+    window=float(os.getenv("MARK_READ_BATCH_WINDOW", "0.05")),
+    max_batch=BATCH_MODIFY_LIMIT,
+    # A 4xx (e.g. an invalid id) is caused by some id in the batch; isolate it so the rest still succeed
+    should_split=lambda exc: isinstance(exc, HttpError) and 400 <= exc.resp.status < 500 and not is_rate_limited(exc),
+)
 
 @app.post("/mark-as-read")
-async def mark_email_as_read(request: MarkAsReadRequest):
+async def mark_email_as_read(request: MarkAsReadRequest, timeout: Optional[float] = Depends(request_timeout)):
     try:
-        gmail, _ = get_services()
-        gmail.users().messages().modify(userId="me", id=request.message_id, body={"removeLabelIds": ["UNREAD"]}).execute()
+        await asyncio.wait_for(mark_read_batcher.submit(request.message_id), timeout or google.default_timeout)
         return {"status": "Email marked as read"}
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail=UPSTREAM_TIMEOUT_DETAIL)
     except Exception as e:
         logger.error(f"Error marking email as read: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/send-email")
+@app.post("/mark-as-read/bulk")
+async def mark_emails_as_read(request: BulkMarkAsReadRequest, timeout: Optional[float] = Depends(request_timeout)):
+    message_ids = list(dict.fromkeys(request.message_ids))
+    if not message_ids:
+        raise HTTPException(status_code=400, detail="No message ids provided.")
+    try:
+        await google.run(lambda gmail, _: mark_messages_read(gmail, message_ids), timeout=timeout)
+        return {"status": "Emails marked as read", "count": len(message_ids)}
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail=UPSTREAM_TIMEOUT_DETAIL)
+    except Exception as e:
+        logger.error(f"Error marking emails as read: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+send_rate = TokenBucket(rate=float(os.getenv("OUTBOX_SENDS_PER_SECOND", "2")), capacity=5)
+
+# messages.send is not idempotent: one attempt per claim, and the outbox decides whether a retry is safe
+send_scheduler = UpstreamScheduler(buckets=scheduler.buckets, retry_budget=scheduler.retry_budget, max_attempts=1)
+
+def send_raw_message(gmail, raw_message: str) -> dict:
+    send_rate.acquire(1)
+    return send_scheduler.execute(gmail.users().messages().send(userId="me", body={"raw": raw_message}))
+
+outbox = Outbox(
+    os.getenv("OUTBOX_DB_PATH", "outbox.db"),
+    send_raw=lambda raw_message: google.run(lambda gmail, _: send_raw_message(gmail, raw_message)),
+    workers=int(os.getenv("OUTBOX_WORKERS", "4")),
+    max_pending=int(os.getenv("OUTBOX_MAX_PENDING", "1000")),
+)
+
+@app.on_event("startup")
+async def start_outbox():
+    outbox.start()
+
+@app.on_event("shutdown")
+async def stop_outbox():
+    await outbox.stop()
+
+@app.post("/send-email", status_code=status.HTTP_202_ACCEPTED)
 async def send_email(request: EmailRequest):
     try:
-        gmail, _ = get_services()
-        message = MIMEText(request.body)
-        message["to"] = request.to
-        message["subject"] = request.subject
-        raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode("utf-8")
-        gmail.users().messages().send(userId="me", body={"raw": raw_message}).execute()
-        return {"status": "Email sent successfully"}
+        send_id = outbox.enqueue(request.to, request.subject, request.body)
+        return {"status": "Email queued", "id": send_id}
+    except OutboxFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
     except Exception as e:
-        logger.error(f"Error sending email: {e}")
+        logger.error(f"Error queueing email: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/send-email/{send_id}")
+async def send_status(send_id: str):
+    send = outbox.get(send_id)
+    if send is None:
+        raise HTTPException(status_code=404, detail="Unknown send id")
+    return send
+
+@app.post("/generate-email")
+async def generate_email(request: GenerateEmailRequest, fastapi_request: Request, stream: bool = False,
+                         timeout: Optional[float] = Depends(request_timeout)):
+    if request.email_history is not None:
+        email_history = "\n".join(request.email_history)
+    else:
+        # The local index answers without a network call; only ask Gmail when it has nothing
+        email_history = context_retriever.local_context(request.subject)
+        if not email_history:
+            try:
+                email_history = await google.run(lambda gmail, _: context_retriever.build_context(gmail, request.subject), timeout=timeout)
+            except Exception as e:
+                logger.warning(f"Could not fetch email history for generation context: {e}")
+    messages = email_prompt(request.subject, email_history or "No previous email history available.")
+
+    if stream or "text/event-stream" in fastapi_request.headers.get("accept", ""):
+        async def events():
+            started = time.perf_counter()
+            ttft = None
+            try:
+                async for delta in llm.stream(messages):
+                    if ttft is None:
+                        ttft = time.perf_counter() - started
+                    yield sse_event({"token": delta})
+                yield sse_event({"ttft_ms": round(ttft * 1000) if ttft is not None else None}, event="done")
+            except Exception as e:
+                logger.error(f"Error streaming generated email: {e}")
+                yield sse_event({"detail": str(e)}, event="error")
+
+        return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+    try:
+        return {"email_content": await llm.complete(messages)}
+    except Exception as e:
+        logger.error(f"Error generating email: {e}")
+        raise HTTPException(status_code=502, detail=str(e))
+
 @app.post("/create-event")
-async def create_event(request: CreateEventRequest):
+async def create_event(request: CreateEventRequest, timeout: Optional[float] = Depends(request_timeout)):
     try:
-        _, calendar = get_services()
-        
         # Log the incoming date/time values
         logger.info(f"Received start_datetime: {request.start_datetime}")
         logger.info(f"Received end_datetime: {request.end_datetime}")
@@ -235,26 +518,114 @@ async def create_event(request: CreateEventRequest):
         # Log the event being sent to Google Calendar API
         logger.info(f"Creating event with data: {json.dumps(event)}")
         
-        created_event = calendar.events().insert(calendarId="primary", body=event).execute()
+        created_event = await google.run(
+            lambda _, calendar: scheduler.execute(calendar.events().insert(calendarId="primary", body=event)),
+            timeout=timeout,
+        )
         
         # Log the created event response
         logger.info(f"Created event response: {json.dumps(created_event)}")
         
         return {"status": "Event created", "eventId": created_event["id"]}
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail=UPSTREAM_TIMEOUT_DETAIL)
     except Exception as e:
         logger.error(f"Error creating event: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/health")
-async def health_check():
+MAX_BULK_EVENTS = 200
+
+def event_id_for(idempotency_key: str) -> str:
+    """Derive a stable Calendar event id (base32hex, as the API requires) from a client key.
+
+    Inserting twice with the same key hits the same event id, so a retried
+    request gets a 409 from Google instead of creating a duplicate.
+    """
+    digest = hashlib.sha256(idempotency_key.encode("utf-8")).digest()
+    return base64.b32hexencode(digest).decode("ascii").rstrip("=").lower()
+
+@app.post("/create-events")
+async def create_events(request: CreateEventsRequest, timeout: Optional[float] = Depends(request_timeout)):
+    if not request.events:
+        raise HTTPException(status_code=400, detail="No events provided.")
+    if len(request.events) > MAX_BULK_EVENTS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BULK_EVENTS} events per request.")
+
+    bodies = {}
+    for item in request.events:
+        bodies.setdefault(event_id_for(item.idempotency_key), {
+            "id": event_id_for(item.idempotency_key),
+            "summary": item.summary,
+            "description": item.description,
+            "start": {"dateTime": item.start_datetime, "timeZone": "Asia/Kolkata"},
+            "end": {"dateTime": item.end_datetime, "timeZone": "Asia/Kolkata"},
+            "attendees": [{"email": email} for email in item.attendees or []]
+        })
+
+    def insert_all(_, calendar):
+        events = calendar.events()
+        return scheduler.execute_batch(
+            calendar, list(bodies),
+            lambda event_id: events.insert(calendarId="primary", body=bodies[event_id]),
+            api="calendar",
+            cost_per_request=1,
+        )
+
     try:
-        gmail, calendar = get_services()
-        gmail.users().getProfile(userId="me").execute()
-        calendar.calendarList().list().execute()
-        return {"status": "healthy", "message": "Services are running normally"}
+        created, errors = await google.run(insert_all, timeout=timeout)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail=UPSTREAM_TIMEOUT_DETAIL)
     except Exception as e:
-        logger.error(f"Health check failed: {e}")
-        raise HTTPException(status_code=503, detail=str(e))
+        logger.error(f"Error creating events: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    results = []
+    for item in request.events:
+        event_id = event_id_for(item.idempotency_key)
+        result = {"idempotency_key": item.idempotency_key, "eventId": event_id}
+        if event_id in created:
+            result["status"] = "created"
+        elif isinstance(errors.get(event_id), HttpError) and errors[event_id].resp.status == 409:
+            result["status"] = "exists"
+        else:
+            result["status"] = "failed"
+            result["error"] = str(errors.get(event_id))
+        results.append(result)
+    return {"results": results}
+
+health = HealthProber(
+    {
+        "gmail": lambda: google.run(lambda gmail, _: scheduler.execute(gmail.users().getProfile(userId="me"))),
+        "calendar": lambda: google.run(lambda _, calendar: scheduler.execute(calendar.calendarList().list(maxResults=1))),
+    },
+    interval=float(os.getenv("HEALTH_PROBE_INTERVAL", "30")),
+)
+
+@app.on_event("startup")
+async def start_health_prober():
+    health.start()
+
+@app.on_event("shutdown")
+async def stop_health_prober():
+    await health.stop()
+
+@app.get("/health")
+async def health_check():
+    """Upstream health from the background prober; never calls Google itself."""
+    upstreams = health.status()
+    if not health.healthy:
+        raise HTTPException(status_code=503, detail={"status": "unhealthy", "upstreams": upstreams})
+    return {"status": "healthy", "message": "Services are running normally", "upstreams": upstreams}
+
+@app.get("/health/live")
+async def liveness_check():
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness_check():
+    if not getattr(app.state, "ready", False):
+        raise HTTPException(status_code=503, detail="Service is still starting")
+    return {"status": "ready"}
 
 if __name__ == "__main__":
     import uvicorn
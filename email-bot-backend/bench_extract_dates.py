@@ -0,0 +1,116 @@
+"""Compare the dateparser-based extract_dates from before the fast path with the current one.
+
+    python bench_extract_dates.py [--snippets 2000] [--min-speedup 10]
+
+Runs both over the same generated snippet corpus, lists snippets where
+they disagree (expected only for dates falling on today, see _fast_date),
+and exits non-zero if the cold-cache speedup is below --min-speedup.
+"""
+import argparse
+import random
+import re
+import sys
+import time
+from typing import List
+
+import dateparser
+
+from date_extractor import extract_dates, parse_date, parse_time
+
+MONTH_NAMES = ["January", "February", "March", "April", "May", "June", "July",
+               "August", "September", "October", "November", "December"]
+FILLER = [
+    "Hi team, quick reminder about the sync.", "Please find the agenda attached.",
+    "Let me know if that works for you.", "Thanks for the update!", "Can we move this?",
+    "The invoice is overdue.", "Looking forward to catching up.", "See notes below.",
+]
+
+
+def extract_dates_before(text: str) -> List[str]:
+    """extract_dates as it was before the fast path: dateparser for every date and time."""
+    combined_text = ' '.join(text.splitlines())
+
+    # Match date like: April 10th, 2025
+    date_pattern = r'((?:\d{1,2}(?:st|nd|rd|th)?\s+)?(?:January|February|March|April|May|June|July|August|September|October|November|December)\s+\d{1,2}(?:st|nd|rd|th)?(?:,?\s*\d{4})?)'
+
+    # Match time like: 3:00 PM or 3 PM
+    time_pattern = r'(\d{1,2}(?::\d{2})?\s*(?:AM|PM|am|pm))'
+
+    date_match = re.search(date_pattern, combined_text, re.IGNORECASE)
+    time_match = re.search(time_pattern, combined_text, re.IGNORECASE)
+
+    if date_match:
+        date_str = date_match.group()
+        parsed_date = dateparser.parse(date_str, settings={'PREFER_DATES_FROM': 'future'})
+        if not parsed_date:
+            return []
+
+        if time_match:
+            time_str = time_match.group()
+            parsed_time = dateparser.parse(time_str)
+            if parsed_time:
+                combined = parsed_date.replace(hour=parsed_time.hour, minute=parsed_time.minute)
+                return [combined.isoformat()]
+
+        # Only date
+        return [parsed_date.isoformat()]
+
+    return []
+
+
+def snippet_corpus(count: int, seed: int = 0) -> List[str]:
+    """Inbox-like snippets: most mention a date, some a time too, some neither."""
+    rng = random.Random(seed)
+    snippets = []
+    for _ in range(count):
+        parts = [rng.choice(FILLER)]
+        kind = rng.random()
+        if kind < 0.7:
+            month, day = rng.choice(MONTH_NAMES), rng.randint(1, 28)
+            suffix = rng.choice(["", "th"]) if day > 3 else ""
+            year = rng.choice(["", f", {rng.randint(2025, 2027)}"])
+            parts.append(f"Meeting on {month} {day}{suffix}{year}")
+            if rng.random() < 0.6:
+                parts.append(f"at {rng.randint(1, 12)}{rng.choice(['', ':30', ':15'])} {rng.choice(['AM', 'PM', 'pm'])}")
+        elif kind < 0.8:
+            parts.append(f"Call at {rng.randint(1, 12)} PM")
+        parts.append(rng.choice(FILLER))
+        snippets.append("\n".join(parts))
+    return snippets
+
+
+def timed(fn, snippets: List[str]):
+    started = time.perf_counter()
+    results = [fn(snippet) for snippet in snippets]
+    return time.perf_counter() - started, results
+
+
+def main() -> int:
+    args = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    args.add_argument("--snippets", type=int, default=2000)
+    args.add_argument("--min-speedup", type=float, default=10.0)
+    options = args.parse_args()
+
+    snippets = snippet_corpus(options.snippets)
+    # Import and warm dateparser up front so its one-off start-up cost isn't billed to either side
+    dateparser.parse("April 10 2025")
+
+    before, expected = timed(extract_dates_before, snippets)
+    parse_date.cache_clear()
+    parse_time.cache_clear()
+    cold, results = timed(extract_dates, snippets)
+    warm, _ = timed(extract_dates, snippets)
+
+    mismatches = [(snippet, old, new) for snippet, old, new in zip(snippets, expected, results) if old != new]
+    per_snippet = lambda seconds: seconds / len(snippets) * 1e6
+    print(f"{len(snippets)} snippets, {len(mismatches)} differing results")
+    for snippet, old, new in mismatches:
+        print(f"  {snippet!r}: before {old}, after {new}")
+    print(f"before:          {before:8.3f}s  {per_snippet(before):9.1f}us/snippet")
+    print(f"after (cold):    {cold:8.3f}s  {per_snippet(cold):9.1f}us/snippet  {before / cold:7.1f}x")
+    print(f"after (cached):  {warm:8.3f}s  {per_snippet(warm):9.1f}us/snippet  {before / warm:7.1f}x")
+    return 0 if before / cold >= options.min_speedup else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+"""Check completion streaming and TTFT logging against a local stub chat-completions server.
+
+    python bench_llm_stream.py [--first-token 0.3] [--tokens 20] [--interval 0.05]
+
+The stub waits --first-token seconds, then sends --tokens SSE deltas
+--interval seconds apart. Both CompletionClient.stream and a streamed
+/generate-email are run against it. The script exits non-zero unless:
+tokens arrive before the completion has finished, the text comes through
+intact, CompletionClient logs its time to first token, and the "done"
+event carries ttft_ms.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Tuple
+
+import httpx
+import uvicorn
+
+WORDS = ["Thanks", "for", "the", "update,", "I'll", "review", "the", "notes", "and", "reply", "by", "Friday."]
+
+
+def stub_server(first_token: float, tokens: int, interval: float) -> ThreadingHTTPServer:
+    """A Together-style /chat/completions endpoint that streams canned deltas with fixed delays."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            if not payload.get("stream"):
+                self.send_error(400, "expected stream=true")
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            time.sleep(first_token)
+            for index in range(tokens):
+                if index:
+                    time.sleep(interval)
+                delta = {"choices": [{"delta": {"content": f"{WORDS[index % len(WORDS)]} "}}]}
+                self.wfile.write(f"data: {json.dumps(delta)}\n\n".encode())
+                self.wfile.flush()
+            self.wfile.write(b"data: [DONE]\n\n")
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def expected_text(tokens: int) -> str:
+    return "".join(f"{WORDS[index % len(WORDS)]} " for index in range(tokens))
+
+
+class Captured(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+async def client_stream(llm, tokens: int):
+    """Stream through CompletionClient; returns (text, seconds to first delta, total seconds)."""
+    from llm_client import email_prompt
+
+    started = time.perf_counter()
+    first = None
+    text = ""
+    async for delta in llm.stream(email_prompt("Status", "No previous email history available.")):
+        if first is None:
+            first = time.perf_counter() - started
+        text += delta
+    return text, first, time.perf_counter() - started
+
+
+def serve_app(app) -> Tuple[uvicorn.Server, str]:
+    """Serve app on a free local port, skipping the startup hooks (they need Google credentials).
+
+    httpx's ASGITransport buffers whole responses, so streaming has to be checked over real HTTP.
+    """
+
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    server = uvicorn.Server(uvicorn.Config(app, lifespan="off", log_level="warning"))
+    threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return server, f"http://127.0.0.1:{sock.getsockname()[1]}"
+
+
+async def endpoint_stream(base_url: str):
+    """Stream a /generate-email response; returns (text, seconds to first token event, total seconds, done event)."""
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        started = time.perf_counter()
+        first = None
+        text, event, done = "", "message", None
+        async with client.stream("POST", "/generate-email", params={"stream": "true"},
+                                 json={"subject": "Status", "email_history": ["Can you send the notes?"]}) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if line.startswith("event:"):
+                    event = line[len("event:"):].strip()
+                elif line.startswith("data:"):
+                    data = json.loads(line[len("data:"):])
+                    if event == "done":
+                        done = data
+                    elif event == "error":
+                        raise RuntimeError(f"stream failed: {data}")
+                    else:
+                        if first is None:
+                            first = time.perf_counter() - started
+                        text += data["token"]
+                elif not line:
+                    event = "message"
+        return text, first, time.perf_counter() - started, done
+
+
+def main() -> int:
+    args = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    args.add_argument("--first-token", type=float, default=0.3, help="seconds before the first delta")
+    args.add_argument("--tokens", type=int, default=20)
+    args.add_argument("--interval", type=float, default=0.05, help="seconds between deltas")
+    options = args.parse_args()
+
+    server = stub_server(options.first_token, options.tokens, options.interval)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    # app reads these at import time
+    os.environ["TOGETHER_API_BASE"] = base_url
+    os.environ.setdefault("TOGETHER_API_KEY", "stub")
+
+    captured = Captured()
+    logging.getLogger("llm_client").addHandler(captured)
+    logging.getLogger("llm_client").setLevel(logging.INFO)
+
+    from llm_client import CompletionClient
+    import app
+
+    async def run():
+        llm = CompletionClient("stub", base_url=base_url)
+        try:
+            return await client_stream(llm, options.tokens)
+        finally:
+            await llm.aclose()
+
+    text, first, total = asyncio.run(run())
+    app_server, app_url = serve_app(app.app)
+    endpoint_text, endpoint_first, endpoint_total, done = asyncio.run(endpoint_stream(app_url))
+    app_server.should_exit = True
+    server.shutdown()
+
+    streaming_span = (options.tokens - 1) * options.interval
+    ttft_logs = [message for message in captured.messages if "time to first token" in message]
+    checks = {
+        "client text intact": text == expected_text(options.tokens),
+        "client tokens arrive before the end": first is not None and total - first >= streaming_span / 2,
+        "endpoint text intact": endpoint_text == expected_text(options.tokens),
+        "endpoint tokens arrive before the end": endpoint_first is not None and endpoint_total - endpoint_first >= streaming_span / 2,
+        "TTFT logged for both streams": len(ttft_logs) == 2,
+        "done event carries ttft_ms": bool(done) and isinstance(done.get("ttft_ms"), int),
+    }
+
+    print(f"stub: first token after {options.first_token * 1000:.0f}ms, {options.tokens} tokens {options.interval * 1000:.0f}ms apart")
+    ms = lambda seconds: f"{seconds * 1000:7.0f}ms" if seconds is not None else "   none"
+    print(f"CompletionClient:  first token {ms(first)}  complete {ms(total)}")
+    print(f"/generate-email:   first token {ms(endpoint_first)}  complete {ms(endpoint_total)}"
+          f"  done ttft_ms={done and done.get('ttft_ms')}")
+    for message in ttft_logs:
+        print(f"  logged: {message}")
+    for name, passed in checks.items():
+        print(f"{'ok  ' if passed else 'FAIL'} {name}")
+    return 0 if all(checks.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+"""Latency of a full unread sync against a mocked Gmail API, by inbox size.
+
+    python bench_message_details.py [--rtt 0.05] [--sizes 5,50,100,500] [--concurrency 4]
+
+Every HTTP round trip to the fake Gmail server takes --rtt seconds, whether
+it carries one call or a batch of 50. Each run builds its own scheduler,
+MailboxStore (in a temporary directory) and MailboxSync, and times a first
+sync: getProfile, messages.list, then metadata for every unread message.
+
+  sequential  one messages.get per message, as before batching
+  batched     get_message_details_batch, one batch at a time
+  concurrent  get_message_details_batch, --concurrency batches in flight
+  quota       as concurrent, under the real 250 units/s Gmail bucket
+
+messages.get costs 5 units, so the bucket admits one 50-message batch per
+second and `quota` grows by about a second per 50 messages past the first
+batch. That is Gmail's per-user limit, not round trips.
+"""
+import argparse
+import functools
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+
+import httplib2
+from googleapiclient.discovery import build
+
+from app import build_email_info, get_message_details_batch
+from mailbox_store import MailboxStore, MailboxSync
+from upstream_scheduler import RetryBudget, TokenBucket, UpstreamScheduler
+
+
+class FakeGmailHttp:
+    """Answers getProfile, messages.list and messages.get (singly or batched) after a fixed delay.
+
+    Thread-safe, so one instance can stand in for every sender thread's connection.
+    """
+
+    def __init__(self, rtt: float, unread: int = 0):
+        self.rtt = rtt
+        self.unread = unread
+        self.round_trips = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def message(message_id: str) -> dict:
+        headers = [{"name": "From", "value": "a@example.com"}, {"name": "Subject", "value": f"Re: {message_id}"},
+                   {"name": "Date", "value": "Mon, 1 Jan 2030 10:00:00 +0000"}]
+        return {
+            "id": message_id, "snippet": "Meeting on April 10th at 3 PM", "labelIds": ["UNREAD", "INBOX"],
+            "internalDate": str(1_900_000_000_000 + int(message_id[1:])), "payload": {"headers": headers},
+        }
+
+    def answer(self, path: str, query: dict) -> dict:
+        if path.endswith("/profile"):
+            return {"historyId": "1"}
+        if path.endswith("/messages"):
+            count = min(self.unread, int(query.get("maxResults", ["100"])[0]))
+            return {"messages": [{"id": f"m{index}"} for index in range(count)]}
+        return self.message(path.rsplit("/", 1)[-1])
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        time.sleep(self.rtt)
+        with self._lock:
+            self.round_trips += 1
+        url = urlsplit(uri)
+        if url.path.startswith("/batch"):
+            return self._batch(body.decode() if isinstance(body, bytes) else body)
+        content = json.dumps(self.answer(url.path, parse_qs(url.query))).encode()
+        return httplib2.Response({"status": "200", "content-type": "application/json"}), content
+
+    def _batch(self, body: str):
+        boundary = "batch_response"
+        parts = []
+        for content_id, path in re.findall(r"Content-ID: <([^>]+)>.*?GET (\S+) HTTP", body, re.DOTALL):
+            url = urlsplit(path)
+            parts.append(
+                f"--{boundary}\r\nContent-Type: application/http\r\nContent-ID: <response-{content_id}>\r\n\r\n"
+                f"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n\r\n{json.dumps(self.answer(url.path, parse_qs(url.query)))}\r\n"
+            )
+        content = "".join(parts) + f"--{boundary}--\r\n"
+        return httplib2.Response({"status": "200", "content-type": f"multipart/mixed; boundary={boundary}"}), content.encode()
+
+
+def sequential_details(service, message_ids):
+    """What /unread-emails did before batching: one messages.get round trip per message."""
+    return {
+        message_id: service.users().messages().get(
+            userId="me", id=message_id, format="metadata", metadataHeaders=["From", "Subject", "Date"],
+        ).execute()
+        for message_id in message_ids
+    }, {}
+
+
+def time_full_sync(service, size: int, fetch_details, scheduler: UpstreamScheduler) -> float:
+    with tempfile.TemporaryDirectory() as directory:
+        store = MailboxStore(os.path.join(directory, "mailbox.db"))
+        store.open()
+        mailbox = MailboxSync(store, fetch_details=fetch_details, build_info=build_email_info,
+                              execute=scheduler.execute, full_sync_limit=size)
+        started = time.perf_counter()
+        mailbox.sync(service)
+        elapsed = time.perf_counter() - started
+        assert len(store.unread()) == size and not mailbox.pending()
+    return elapsed
+
+
+def main():
+    args = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    args.add_argument("--rtt", type=float, default=0.05, help="seconds per HTTP round trip")
+    args.add_argument("--sizes", default="5,50,100,500")
+    args.add_argument("--concurrency", type=int, default=4, help="batches in flight at once")
+    options = args.parse_args()
+
+    http = FakeGmailHttp(options.rtt)
+    service = build("gmail", "v1", http=http, static_discovery=True)
+
+    def scheduler(concurrency: int = 1, quota: bool = False) -> UpstreamScheduler:
+        # A fresh, full bucket per run, as for a process that has been idle
+        buckets = {"gmail": TokenBucket(rate=250, capacity=250)} if quota else {}
+        return UpstreamScheduler(buckets=buckets, retry_budget=RetryBudget(),
+                                 batch_concurrency=concurrency, http_factory=lambda: http)
+
+    variants = {
+        "sequential": lambda: (sequential_details, scheduler()),
+        "batched": lambda: scheduler(),
+        "concurrent": lambda: scheduler(options.concurrency),
+        "quota": lambda: scheduler(options.concurrency, quota=True),
+    }
+    print(f"{'messages':>8}" + "".join(f"{name:>13}" for name in variants) + "   (seconds; round trips in brackets)")
+    for size in (int(size) for size in options.sizes.split(",")):
+        http.unread = size
+        row = f"{size:>8}"
+        for name, make in variants.items():
+            made = make()
+            if isinstance(made, tuple):
+                fetch_details, batch_scheduler = made
+            else:
+                batch_scheduler = made
+                fetch_details = functools.partial(get_message_details_batch, scheduler=batch_scheduler)
+            http.round_trips = 0
+            elapsed = time_full_sync(service, size, fetch_details, batch_scheduler)
+            batch_scheduler.shutdown()
+            row += f"{f'{elapsed:.2f}[{http.round_trips}]':>13}"
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""Time from process start to ready and to the first real request, baseline app vs current.
+
+    python bench_startup.py [--baseline 7eab938] [--rtt 0.05] [--runs 3]
+
+Each run starts the app under uvicorn in a fresh subprocess and working
+directory (with a fake, unexpired token.json). It polls /health/ready until
+it answers 200, then times POST /create-event, which is one events.insert
+in both versions. An app without /health/ready (the baseline answers 404)
+counts as ready once it answers at all. The baseline is exported from git
+at --baseline.
+
+There is no network here, so the child swaps httplib2 for a fake Google that
+answers after --rtt seconds. Discovery downloads get the documents bundled
+with googleapiclient, Gmail and Calendar calls get canned replies. Times are
+medians over --runs, in ms from process start.
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+EVENT = {"summary": "Sync", "start_datetime": "2030-01-07T15:00:00", "end_datetime": "2030-01-07T16:00:00"}
+
+
+def fake_google(rtt: float):
+    """Replace httplib2.Http.request with canned Google answers delayed by rtt (child process only)."""
+    import httplib2
+    from googleapiclient import discovery_cache
+
+    def request(self, uri, method="GET", body=None, headers=None, *args, **kwargs):
+        time.sleep(rtt)
+        if "discovery" in uri:
+            api = "gmail" if "gmail" in uri else "calendar"
+            content = discovery_cache.get_static_doc(api, "v1" if api == "gmail" else "v3")
+        elif uri.split("?")[0].endswith("/events") and method == "POST":
+            content = json.dumps({"id": "event1", **json.loads(body)})
+        elif "/profile" in uri or "/history" in uri:
+            content = json.dumps({"historyId": "1", "history": []})
+        else:
+            content = json.dumps({"messages": [], "items": []})
+        return httplib2.Response({"status": "200", "content-type": "application/json"}), content.encode()
+
+    httplib2.Http.request = request
+
+
+def serve(app_dir: str, port: int, rtt: float):
+    """Child process: run app_dir/app.py on port against the fake Google."""
+    import uvicorn
+
+    fake_google(rtt)
+    sys.path.insert(0, app_dir)
+    uvicorn.run("app:app", host="127.0.0.1", port=port, log_level="warning")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def call(url: str, body: dict = None) -> int:
+    data = json.dumps(body).encode() if body is not None else None
+    request = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request, timeout=60) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def time_startup(app_dir: str, rtt: float) -> dict:
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    with tempfile.TemporaryDirectory() as workdir:
+        with open(os.path.join(workdir, "token.json"), "w") as f:
+            json.dump({"token": "fake", "refresh_token": "fake", "client_id": "fake", "client_secret": "fake",
+                       "token_uri": "https://oauth2.googleapis.com/token", "expiry": "2099-01-01T00:00:00Z"}, f)
+        started = time.perf_counter()
+        child = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--serve", app_dir, "--port", str(port), "--rtt", str(rtt)],
+            cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            while True:
+                if child.poll() is not None:
+                    raise RuntimeError(f"{app_dir}/app.py exited with {child.returncode} before becoming ready")
+                try:
+                    if call(f"{base}/health/ready") in (200, 404):
+                        break
+                except OSError:
+                    pass
+                time.sleep(0.01)
+            ready = time.perf_counter() - started
+            for attempt in ("first", "second"):
+                request_started = time.perf_counter()
+                status = call(f"{base}/create-event", EVENT)
+                if status != 200:
+                    raise RuntimeError(f"{attempt} /create-event returned {status}")
+                if attempt == "first":
+                    first, first_latency = time.perf_counter() - started, time.perf_counter() - request_started
+                else:
+                    second_latency = time.perf_counter() - request_started
+        finally:
+            child.terminate()
+            child.wait()
+    return {"ready": ready, "first": first, "first_latency": first_latency, "second_latency": second_latency}
+
+
+def export_baseline(ref: str, directory: str) -> str:
+    """Write email-bot-backend as of ref into directory and return its path."""
+    root = subprocess.run(["git", "rev-parse", "--show-toplevel"], cwd=HERE, check=True,
+                          capture_output=True, text=True).stdout.strip()
+    prefix = os.path.relpath(HERE, root)
+    archive = subprocess.run(["git", "archive", ref, prefix], cwd=root, check=True, capture_output=True).stdout
+    subprocess.run(["tar", "-x", "-C", directory], input=archive, check=True)
+    return os.path.join(directory, prefix)
+
+
+def main():
+    args = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    args.add_argument("--baseline", default="7eab938", help="git ref of the app to compare against")
+    args.add_argument("--rtt", type=float, default=0.05, help="seconds per fake Google round trip")
+    args.add_argument("--runs", type=int, default=3)
+    args.add_argument("--serve", help=argparse.SUPPRESS)
+    args.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    options = args.parse_args()
+    if options.serve:
+        serve(options.serve, options.port, options.rtt)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        versions = {options.baseline: export_baseline(options.baseline, directory), "current": HERE}
+        print(f"{'version':>10}{'ready':>10}{'first request':>15}{'first latency':>15}{'second latency':>16}"
+              f"   (ms, median of {options.runs}; rtt {options.rtt * 1000:.0f}ms)")
+        for name, app_dir in versions.items():
+            runs = [time_startup(app_dir, options.rtt) for _ in range(options.runs)]
+            median = {key: statistics.median(run[key] for run in runs) * 1000 for key in runs[0]}
+            print(f"{name:>10}{median['ready']:>10.0f}{median['first']:>15.0f}"
+                  f"{median['first_latency']:>15.0f}{median['second_latency']:>16.0f}")
+
+
+if __name__ == "__main__":
+    main()
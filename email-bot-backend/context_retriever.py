@@ -0,0 +1,112 @@
+import re
+import threading
+from collections import OrderedDict
+from typing import Callable, Iterable, List, Optional
+
+from mailbox_store import MailboxStore
+from upstream_scheduler import GMAIL_QUOTA_UNITS, UpstreamScheduler
+
+
+# "Re:", "Fwd:" and friends, possibly repeated; they'd otherwise have to match as search terms
+REPLY_PREFIX = re.compile(r"^(\s*(re|fwd?|aw|sv)\s*(\[\d+\])?\s*:)+", re.IGNORECASE)
+
+
+def estimate_tokens(text: str) -> int:
+    # Roughly four characters per token for English text
+    return len(text) // 4 + 1
+
+
+class SnippetCache:
+    """Bounded LRU of message id -> snippet. Snippets never change for a message id."""
+
+    def __init__(self, max_size: int = 5000):
+        self.max_size = max_size
+        self._items: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, message_id: str) -> Optional[str]:
+        with self._lock:
+            snippet = self._items.get(message_id)
+            if snippet is not None:
+                self._items.move_to_end(message_id)
+            return snippet
+
+    def put(self, message_id: str, snippet: str):
+        with self._lock:
+            self._items[message_id] = snippet
+            self._items.move_to_end(message_id)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+
+class ContextRetriever:
+    """Builds email-generation context from previous messages on the same subject.
+
+    One `messages.list` finds the ids and a single batch of
+    `format=metadata` gets fetches only the snippets that aren't cached yet,
+    so no message bodies or attachments are downloaded. Snippets are added
+    newest first until the token budget is spent. With a `store`, fetched
+    messages are also written to the local index for `local_context`.
+    """
+
+    METADATA_FIELDS = "id,snippet,labelIds,internalDate,payload/headers"
+
+    def __init__(self, scheduler: UpstreamScheduler, cache: Optional[SnippetCache] = None,
+                 max_messages: int = 15, token_budget: int = 1000, store: Optional[MailboxStore] = None,
+                 build_info: Optional[Callable[[str, dict], dict]] = None):
+        self.scheduler = scheduler
+        self.cache = cache or SnippetCache()
+        self.max_messages = max_messages
+        self.token_budget = token_budget
+        if store is not None and build_info is None:
+            raise ValueError("build_info is required to write fetched messages to the store")
+        self.store = store
+        self._build_info = build_info
+
+    def snippets(self, gmail, subject: str) -> List[str]:
+        response = self.scheduler.execute(gmail.users().messages().list(
+            userId="me", q=f"subject:{subject}", maxResults=self.max_messages, fields="messages(id)",
+        ))
+        message_ids = [msg["id"] for msg in response.get("messages", [])]
+        missing = [message_id for message_id in message_ids if self.cache.get(message_id) is None]
+        if missing:
+            messages = gmail.users().messages()
+            fetched, _ = self.scheduler.execute_batch(
+                gmail, missing,
+                lambda message_id: messages.get(
+                    userId="me", id=message_id, format="metadata", metadataHeaders=["From", "Subject", "Date"],
+                    fields=self.METADATA_FIELDS if self.store is not None else "id,snippet",
+                ),
+                api="gmail",
+                cost_per_request=GMAIL_QUOTA_UNITS["gmail.users.messages.get"],
+            )
+            for message_id, email_data in fetched.items():
+                self.cache.put(message_id, email_data.get("snippet", ""))
+            if self.store is not None:
+                self.store.upsert_messages(
+                    (self._build_info(message_id, email_data), email_data.get("labelIds", []), int(email_data.get("internalDate", 0)))
+                    for message_id, email_data in fetched.items()
+                )
+        return [snippet for snippet in map(self.cache.get, message_ids) if snippet]
+
+    def local_context(self, subject: str) -> str:
+        """Context from the local full-text index only; empty if nothing relevant is cached."""
+        subject = REPLY_PREFIX.sub("", subject)
+        if self.store is None or not subject.strip():
+            return ""
+        return self._assemble(email["snippet"] for email in self.store.search(subject, self.max_messages))
+
+    def build_context(self, gmail, subject: str) -> str:
+        return self._assemble(self.snippets(gmail, subject))
+
+    def _assemble(self, snippets: Iterable[str]) -> str:
+        context, used = [], 0
+        for snippet in snippets:
+            if not snippet:
+                continue
+            cost = estimate_tokens(snippet)
+            if used + cost > self.token_budget:
+                break
+            context.append(snippet)
+            used += cost
+        return "\n".join(context)
@@ -0,0 +1,112 @@
+import re
+from datetime import date, datetime
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+MONTHS = {
+    name: index
+    for index, name in enumerate(
+        ["january", "february", "march", "april", "may", "june", "july",
+         "august", "september", "october", "november", "december"],
+        start=1,
+    )
+}
+
+# Match date like: April 10th, 2025
+DATE_PATTERN = re.compile(
+    r'((?:\d{1,2}(?:st|nd|rd|th)?\s+)?(?:January|February|March|April|May|June|July|August|September|October|November|December)\s+\d{1,2}(?:st|nd|rd|th)?(?:,?\s*\d{4})?)',
+    re.IGNORECASE,
+)
+
+# Match time like: 3:00 PM or 3 PM
+TIME_PATTERN = re.compile(r'(\d{1,2}(?::\d{2})?\s*(?:AM|PM|am|pm))', re.IGNORECASE)
+
+# Same shapes as above, split into fields for the fast path
+DATE_FIELDS = re.compile(
+    r'(?:(?P<lead>\d{1,2})(?:st|nd|rd|th)?\s+)?(?P<month>[a-z]+)\s+(?P<trail>\d{1,2})(?:st|nd|rd|th)?(?:,?\s*(?P<year>\d{4}))?',
+    re.IGNORECASE,
+)
+TIME_FIELDS = re.compile(r'(?P<hour>\d{1,2})(?::(?P<minute>\d{2}))?\s*(?P<meridiem>am|pm)', re.IGNORECASE)
+
+CACHE_SIZE = 4096
+
+
+def _fast_date(date_str: str, today: date) -> Optional[datetime]:
+    """Parse the shapes DATE_PATTERN matches without dateparser.
+
+    Returns None for anything ambiguous (e.g. "10th April 20", where both a
+    leading and a trailing number are present) so the caller can fall back.
+    """
+    fields = DATE_FIELDS.fullmatch(date_str)
+    if not fields or fields["lead"]:
+        return None
+    month = MONTHS.get(fields["month"].lower())
+    if month is None:
+        return None
+    day = int(fields["trail"])
+    try:
+        if fields["year"]:
+            return datetime(int(fields["year"]), month, day)
+        # Like dateparser's PREFER_DATES_FROM=future for dates without a year, except that today
+        # stays today (dateparser moves it to next year once midnight has passed)
+        candidate = datetime(today.year, month, day)
+        if candidate.date() < today:
+            candidate = datetime(today.year + 1, month, day)
+        return candidate
+    except ValueError:
+        return None
+
+
+def _fast_time(time_str: str) -> Optional[Tuple[int, int]]:
+    fields = TIME_FIELDS.fullmatch(time_str)
+    if not fields:
+        return None
+    hour, minute = int(fields["hour"]), int(fields["minute"] or 0)
+    if not 1 <= hour <= 12 or minute > 59:
+        return None
+    if fields["meridiem"].lower() == "pm":
+        hour = hour % 12 + 12
+    else:
+        hour = hour % 12
+    return hour, minute
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse_date(date_str: str, today: date) -> Optional[datetime]:
+    parsed = _fast_date(date_str, today)
+    if parsed is not None:
+        return parsed
+    import dateparser  # slow import, only needed for unusual formats
+    return dateparser.parse(date_str, settings={'PREFER_DATES_FROM': 'future'})
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse_time(time_str: str) -> Optional[Tuple[int, int]]:
+    parsed = _fast_time(time_str)
+    if parsed is not None:
+        return parsed
+    import dateparser
+    fallback = dateparser.parse(time_str)
+    return (fallback.hour, fallback.minute) if fallback else None
+
+
+def extract_dates(text: str) -> List[str]:
+    combined_text = ' '.join(text.splitlines())
+
+    date_match = DATE_PATTERN.search(combined_text)
+    if not date_match:
+        return []
+
+    parsed_date = parse_date(date_match.group(), date.today())
+    if not parsed_date:
+        return []
+
+    time_match = TIME_PATTERN.search(combined_text)
+    if time_match:
+        parsed_time = parse_time(time_match.group())
+        if parsed_time:
+            hour, minute = parsed_time
+            return [parsed_date.replace(hour=hour, minute=minute).isoformat()]
+
+    # Only date
+    return [parsed_date.isoformat()]
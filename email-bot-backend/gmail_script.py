@@ -5,6 +5,8 @@ from google.oauth2.credentials import Credentials
 from googleapiclient.discovery import build
 from email.mime.text import MIMEText
 from dotenv import load_dotenv
+from context_retriever import ContextRetriever
+from upstream_scheduler import RetryBudget, UpstreamScheduler
 
 # Load environment variables
 load_dotenv()
@@ -23,23 +25,16 @@ except Exception as e:
     print(f"❌ ERROR: Failed to authenticate Gmail API. {e}")
     exit(1)
 
+# Retrieves snippets with metadata-only batch gets and caches them between calls
+context_retriever = ContextRetriever(UpstreamScheduler(buckets={}, retry_budget=RetryBudget()))
+
 # Function to fetch previous emails
 def fetch_emails(subject):
     try:
-        # Fetch up to 15 emails based on the subject
-        response = gmail_service.users().messages().list(userId="me", q=f"subject:{subject}", maxResults=15).execute()
-        messages = response.get("messages", [])
-
-        if not messages:
+        email_history = context_retriever.build_context(gmail_service, subject)
+        if not email_history:
             return "No previous email history found."
-
-        email_threads = []
-        for msg in messages:
-            email_data = gmail_service.users().messages().get(userId="me", id=msg["id"]).execute()
-            snippet = email_data.get("snippet", "")
-            email_threads.append(snippet)
-
-        return "\n".join(email_threads)
+        return email_history
 
     except Exception as e:
         print(f"⚠️ WARNING: Failed to fetch email history. {e}")
@@ -0,0 +1,137 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional, Tuple
+
+import httplib2
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import build_from_document
+
+from upstream_scheduler import deadline_scope
+
+logger = logging.getLogger(__name__)
+
+DISCOVERY_URL = "https://www.googleapis.com/discovery/v1/apis/{api}/{version}/rest"
+APIS = (("gmail", "v1"), ("calendar", "v3"))
+
+
+def load_discovery_document(api: str, version: str, cache_dir: str) -> str:
+    """Return the discovery document for api/version without a network call if possible.
+
+    Looks in cache_dir first, then at the copy bundled with googleapiclient,
+    and only downloads it as a last resort. Whatever is found is written to
+    cache_dir so later restarts read it straight from disk.
+    """
+    path = os.path.join(cache_dir, f"{api}.{version}.json")
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            return f.read()
+    document = discovery_cache.get_static_doc(api, version)
+    if document is None:
+        logger.info(f"Downloading discovery document for {api} {version}")
+        response, content = httplib2.Http(timeout=20).request(DISCOVERY_URL.format(api=api, version=version))
+        if response.status != 200:
+            raise RuntimeError(f"Could not fetch discovery document for {api} {version}: HTTP {response.status}")
+        document = content.decode("utf-8")
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(document)
+    os.replace(tmp_path, path)
+    return document
+
+
+class GoogleExecutor:
+    """Runs blocking googleapiclient calls on a sized thread pool.
+
+    httplib2 connections are not thread-safe, so every worker thread lazily
+    builds its own Gmail and Calendar clients on top of the shared
+    credentials. Handlers await `run()` instead of calling `.execute()` on the
+    event loop, and each call can carry its own deadline.
+    """
+
+    def __init__(self, credentials_loader: Callable, max_workers: int = 32,
+                 default_timeout: float = 30.0, socket_timeout: float = 20.0,
+                 discovery_cache_dir: str = "discovery_cache"):
+        self._credentials_loader = credentials_loader
+        self._credentials = None
+        self._discovery = {}
+        self._init_lock = threading.Lock()
+        self.discovery_cache_dir = discovery_cache_dir
+        self._local = threading.local()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="google-api")
+        self.default_timeout = default_timeout
+        self.socket_timeout = socket_timeout
+
+    def credentials(self):
+        if self._credentials is None:
+            with self._init_lock:
+                if self._credentials is None:
+                    self._credentials = self._credentials_loader()
+        return self._credentials
+
+    def discovery_document(self, api: str, version: str) -> str:
+        document = self._discovery.get((api, version))
+        if document is None:
+            with self._init_lock:
+                document = self._discovery.get((api, version))
+                if document is None:
+                    document = load_discovery_document(api, version, self.discovery_cache_dir)
+                    self._discovery[(api, version)] = document
+        return document
+
+    def warm_up(self):
+        """Load credentials and discovery documents and build clients once, up front.
+
+        Meant to run from a startup hook so a bad token fails the process
+        before it accepts traffic instead of failing the first request.
+        """
+        self.credentials()
+        for api, version in APIS:
+            self.discovery_document(api, version)
+        self._pool.submit(self.services).result()
+
+    def services(self) -> Tuple[Any, Any]:
+        """Return (gmail, calendar) clients owned by the calling thread."""
+        services = getattr(self._local, "services", None)
+        if services is None:
+            creds = self.credentials()
+            gmail, calendar = (
+                build_from_document(self.discovery_document(api, version), http=self._authorized_http(creds))
+                for api, version in APIS
+            )
+            services = self._local.services = (gmail, calendar)
+            logger.info(f"Built Google API clients for thread {threading.current_thread().name}")
+        return services
+
+    def _authorized_http(self, creds) -> AuthorizedHttp:
+        return AuthorizedHttp(creds, http=httplib2.Http(timeout=self.socket_timeout))
+
+    def new_http(self) -> AuthorizedHttp:
+        """A fresh authorized connection, for threads outside the pool (e.g. batch senders)."""
+        return self._authorized_http(self.credentials())
+
+    def _call(self, fn: Callable, args: tuple, deadline: float) -> Any:
+        gmail, calendar = self.services()
+        with deadline_scope(deadline):
+            return fn(gmail, calendar, *args)
+
+    async def run(self, fn: Callable, *args, timeout: Optional[float] = None) -> Any:
+        """Call fn(gmail, calendar, *args) on the pool and await its result.
+
+        Raises asyncio.TimeoutError when the call outlives its deadline. The
+        worker thread is left to finish in the background, bounded by the
+        socket timeout of its HTTP client.
+        """
+        timeout = timeout or self.default_timeout
+        loop = asyncio.get_running_loop()
+        # The deadline travels with the call so the scheduler stops waiting/retrying once it has passed
+        future = loop.run_in_executor(self._pool, self._call, fn, args, time.monotonic() + timeout)
+        return await asyncio.wait_for(future, timeout)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,79 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class UpstreamStatus:
+    def __init__(self, history_size: int):
+        self.ok: Optional[bool] = None
+        self.latency_ms: Optional[float] = None
+        self.error: Optional[str] = None
+        self.checked_at: Optional[str] = None
+        self.history = deque(maxlen=history_size)
+
+    def record(self, ok: bool, latency_ms: float, error: Optional[str]):
+        self.ok, self.latency_ms, self.error = ok, round(latency_ms, 1), error
+        self.checked_at = datetime.now(timezone.utc).isoformat()
+        self.history.append({"ok": ok, "latency_ms": self.latency_ms, "error": error, "checked_at": self.checked_at})
+
+    def as_dict(self) -> dict:
+        return {
+            "ok": self.ok,
+            "latency_ms": self.latency_ms,
+            "error": self.error,
+            "checked_at": self.checked_at,
+            "history": list(self.history),
+        }
+
+
+class HealthProber:
+    """Probes each upstream on an interval and keeps the results in memory.
+
+    Health endpoints read `status()` and never call Google themselves, so
+    load balancer checks cost no quota and add no latency to real traffic.
+    """
+
+    def __init__(self, probes: Dict[str, Callable[[], Awaitable]], interval: float = 30.0, history_size: int = 20):
+        self.probes = probes
+        self.interval = interval
+        self.upstreams = {name: UpstreamStatus(history_size) for name in probes}
+        self._task: Optional[asyncio.Task] = None
+
+    async def probe_once(self):
+        await asyncio.gather(*(self._probe(name, probe) for name, probe in self.probes.items()))
+
+    async def _probe(self, name: str, probe: Callable[[], Awaitable]):
+        started = time.perf_counter()
+        try:
+            await probe()
+        except Exception as e:
+            logger.warning(f"Health probe for {name} failed: {e}")
+            self.upstreams[name].record(False, (time.perf_counter() - started) * 1000, str(e) or type(e).__name__)
+        else:
+            self.upstreams[name].record(True, (time.perf_counter() - started) * 1000, None)
+
+    @property
+    def healthy(self) -> bool:
+        return all(status.ok for status in self.upstreams.values())
+
+    def status(self) -> dict:
+        return {name: status.as_dict() for name, status in self.upstreams.items()}
+
+    async def _loop(self):
+        while True:
+            await self.probe_once()
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
@@ -0,0 +1,92 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Optional, Set
+
+from mailbox_store import MailboxSync
+
+logger = logging.getLogger(__name__)
+
+
+class InboxPoller:
+    """Single shared refresher for the unread view.
+
+    All callers (the background loop, /unread-emails and stream clients) go
+    through `refresh()`, so concurrent refreshes collapse into one upstream
+    sync. After every refresh the poller diffs the unread set against the
+    previous one and pushes {new, read, removed} to every subscriber queue.
+    """
+
+    def __init__(self, mailbox: MailboxSync, run_sync: Callable[[], Awaitable], interval: float = 15.0,
+                 queue_size: int = 100):
+        self.mailbox = mailbox
+        self._run_sync = run_sync
+        self.interval = interval
+        self.queue_size = queue_size
+        self._snapshot: Dict[str, dict] = {}
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._inflight: Optional[asyncio.Task] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def snapshot(self) -> list:
+        return list(self._snapshot.values())
+
+    async def refresh(self) -> list:
+        """Sync the mailbox (coalescing with any sync already in flight) and return unread emails."""
+        if self._inflight is None or self._inflight.done():
+            self._inflight = asyncio.ensure_future(self._refresh())
+        # shield so one cancelled caller doesn't cancel the sync for everyone else
+        await asyncio.shield(self._inflight)
+        return self.snapshot()
+
+    async def _refresh(self):
+        await self._run_sync()
+        current = {email["id"]: email for email in self.mailbox.store.unread()}
+        gone = [message_id for message_id in self._snapshot if message_id not in current]
+        still_cached = self.mailbox.store.existing(gone)
+        diff = {
+            "new": [email for message_id, email in current.items() if message_id not in self._snapshot],
+            "read": [message_id for message_id in gone if message_id in still_cached],
+            "removed": [message_id for message_id in gone if message_id not in still_cached],
+        }
+        self._snapshot = current
+        if any(diff.values()):
+            self._publish(diff)
+
+    def _publish(self, diff: dict):
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(diff)
+            except asyncio.QueueFull:
+                # Too far behind; end its stream so the client reconnects and gets a fresh snapshot
+                logger.warning("Dropping slow inbox subscriber")
+                self.unsubscribe(queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    async def _loop(self):
+        while True:
+            # Nobody is watching; leave refreshes to on-demand requests
+            if self._subscribers:
+                try:
+                    await self.refresh()
+                except Exception as e:
+                    logger.warning(f"Background inbox refresh failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
@@ -0,0 +1,81 @@
+import asyncio
+import json
+import logging
+import time
+from typing import AsyncIterator, List, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+class CompletionClient:
+    """Shared keep-alive client for the Together chat-completions API.
+
+    One httpx.AsyncClient (and its connection pool) is reused by every
+    request, and a semaphore caps how many completions are in flight at once.
+    Point `base_url` at a local server to run against a mock.
+    """
+
+    def __init__(self, api_key: Optional[str], base_url: str = "https://api.together.xyz/v1",
+                 model: str = "mistralai/Mistral-7B-Instruct-v0.1",
+                 max_concurrency: int = 8, timeout: float = 60.0):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.model = model
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={"Authorization": f"Bearer {self.api_key}"},
+                timeout=httpx.Timeout(self.timeout, connect=10.0),
+                limits=httpx.Limits(max_keepalive_connections=20, keepalive_expiry=60.0),
+            )
+        return self._client
+
+    async def stream(self, messages: List[dict], max_tokens: int = 200) -> AsyncIterator[str]:
+        """Yield content deltas as the completion is generated."""
+        if not self.api_key:
+            raise RuntimeError("TOGETHER_API_KEY is not configured")
+        payload = {"model": self.model, "messages": messages, "max_tokens": max_tokens, "stream": True}
+        async with self._semaphore:
+            started = time.perf_counter()
+            first_token = None
+            async with self.client.stream("POST", "/chat/completions", json=payload) as response:
+                if response.is_error:
+                    await response.aread()
+                    response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    choices = json.loads(data).get("choices") or [{}]
+                    delta = choices[0].get("delta", {}).get("content")
+                    if not delta:
+                        continue
+                    if first_token is None:
+                        first_token = time.perf_counter() - started
+                        logger.info(f"Completion time to first token: {first_token * 1000:.0f}ms")
+                    yield delta
+
+    async def complete(self, messages: List[dict], max_tokens: int = 200) -> str:
+        return "".join([delta async for delta in self.stream(messages, max_tokens)]).strip()
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+def email_prompt(subject: str, email_history: str) -> List[dict]:
+    return [
+        {"role": "system", "content": "You are an AI email assistant."},
+        {"role": "user", "content": f"Based on this email history:\n{email_history}\nGenerate a professional email response for the subject: '{subject}'"}
+    ]
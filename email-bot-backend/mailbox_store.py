@@ -0,0 +1,337 @@
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from typing import Callable, Iterable, List, Optional, Set, Tuple
+
+from googleapiclient.errors import HttpError
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id TEXT PRIMARY KEY,
+    sender TEXT,
+    subject TEXT,
+    date TEXT,
+    snippet TEXT,
+    labels TEXT NOT NULL DEFAULT '[]',
+    potential_dates TEXT NOT NULL DEFAULT '[]',
+    internal_date INTEGER NOT NULL DEFAULT 0,
+    unread INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_messages_unread ON messages (unread, internal_date DESC);
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    sender, subject, snippet, content='messages', content_rowid='rowid'
+);
+CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (rowid, sender, subject, snippet) VALUES (new.rowid, new.sender, new.subject, new.snippet);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, sender, subject, snippet) VALUES ('delete', old.rowid, old.sender, old.subject, old.snippet);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF sender, subject, snippet ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, sender, subject, snippet) VALUES ('delete', old.rowid, old.sender, old.subject, old.snippet);
+    INSERT INTO messages_fts (rowid, sender, subject, snippet) VALUES (new.rowid, new.sender, new.subject, new.snippet);
+END;
+CREATE TABLE IF NOT EXISTS sync_state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+# Version 1 added messages_fts; rows cached before it have to be indexed once
+SCHEMA_VERSION = 1
+
+
+def is_unread(labels: Iterable[str]) -> bool:
+    """Unread as /unread-emails means it: `is:unread` leaves out trash and spam."""
+    labels = set(labels)
+    return "UNREAD" in labels and not labels & {"TRASH", "SPAM"}
+
+
+class MailboxStore:
+    """SQLite-backed cache of Gmail message metadata, keyed by message id.
+
+    Nothing touches disk until `open()`, so building one at import time is
+    free; the app opens it from a startup hook.
+    """
+
+    def __init__(self, path: str = "mailbox.db"):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def open(self):
+        """Create or open the database file. Safe to call more than once."""
+        with self._lock:
+            if self._conn is not None:
+                return
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+            # COUNT(*) on an external-content table reads `messages`, so track the index with user_version instead
+            if self._conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+                self._conn.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
+                self._conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def get_state(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+        return row["value"] if row else None
+
+    def set_state(self, key: str, value: Optional[str]):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO sync_state (key, value) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                (key, value),
+            )
+
+    def upsert_messages(self, rows: Iterable[Tuple[dict, List[str], int]]):
+        """Store (email_info, label_ids, internal_date) tuples."""
+        params = [
+            (
+                info["id"], info["from"], info["subject"], info["date"],
+                info["snippet"], json.dumps(labels), json.dumps(info["potentialDates"]),
+                internal_date, int(is_unread(labels)),
+            )
+            for info, labels, internal_date in rows
+        ]
+        with self._lock, self._conn:
+            # An upsert rather than INSERT OR REPLACE so the full-text triggers see an UPDATE
+            self._conn.executemany(
+                "INSERT INTO messages "
+                "(id, sender, subject, date, snippet, labels, potential_dates, internal_date, unread) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET sender = excluded.sender, subject = excluded.subject, "
+                "date = excluded.date, snippet = excluded.snippet, labels = excluded.labels, "
+                "potential_dates = excluded.potential_dates, internal_date = excluded.internal_date, "
+                "unread = excluded.unread",
+                params,
+            )
+
+    def update_labels(self, message_id: str, added: Iterable[str] = (), removed: Iterable[str] = ()) -> bool:
+        """Apply a label delta locally. Returns False if the message is not cached."""
+        removed = set(removed)
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT labels FROM messages WHERE id = ?", (message_id,)).fetchone()
+            if row is None:
+                return False
+            labels = [label for label in json.loads(row["labels"]) if label not in removed]
+            labels += [label for label in added if label not in labels]
+            self._conn.execute(
+                "UPDATE messages SET labels = ?, unread = ? WHERE id = ?",
+                (json.dumps(labels), int(is_unread(labels)), message_id),
+            )
+        return True
+
+    def delete_messages(self, message_ids: Iterable[str]):
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM messages WHERE id = ?", [(mid,) for mid in message_ids])
+
+    def existing(self, message_ids: Iterable[str]) -> Set[str]:
+        """Return the subset of message_ids that are still cached."""
+        message_ids = list(message_ids)
+        if not message_ids:
+            return set()
+        placeholders = ",".join("?" * len(message_ids))
+        with self._lock:
+            rows = self._conn.execute(f"SELECT id FROM messages WHERE id IN ({placeholders})", message_ids).fetchall()
+        return {row["id"] for row in rows}
+
+    def reset_unread(self):
+        """Mark every cached message read, before a full resync re-marks the ones still unread.
+
+        Rows are kept so messages that were read meanwhile stay in the search index.
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE messages SET unread = 0, labels = "
+                "(SELECT json_group_array(value) FROM json_each(messages.labels) WHERE value != 'UNREAD') "
+                "WHERE EXISTS (SELECT 1 FROM json_each(messages.labels) WHERE value = 'UNREAD')"
+            )
+
+    def unread(self, limit: Optional[int] = None) -> List[dict]:
+        query = "SELECT * FROM messages WHERE unread = 1 ORDER BY internal_date DESC, id DESC"
+        params: tuple = ()
+        if limit is not None:
+            query += " LIMIT ?"
+            params = (limit,)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [self._to_email(row) for row in rows]
+
+    def unread_page(self, limit: int, after: Optional[Tuple[int, str]] = None) -> Tuple[List[dict], Optional[Tuple[int, str]]]:
+        """One page of unread emails, newest first, using (internal_date, id) keyset pagination.
+
+        Returns the page and the key to pass as `after` for the next page,
+        or None when this is the last page.
+        """
+        query = "SELECT * FROM messages WHERE unread = 1"
+        params: list = []
+        if after is not None:
+            query += " AND (internal_date < ? OR (internal_date = ? AND id < ?))"
+            params += [after[0], after[0], after[1]]
+        query += " ORDER BY internal_date DESC, id DESC LIMIT ?"
+        params.append(limit + 1)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        next_key = (rows[limit - 1]["internal_date"], rows[limit - 1]["id"]) if len(rows) > limit else None
+        return [self._to_email(row) for row in rows[:limit]], next_key
+
+    def search(self, query: str, limit: int = 10) -> List[dict]:
+        """BM25-ranked full-text search over cached senders, subjects and snippets.
+
+        Every term has to match, so a message sharing one common word with
+        the query doesn't count as relevant.
+        """
+        terms = re.findall(r"\w+", query)
+        if not terms:
+            return []
+        # Quote every term so user text can't be read as FTS5 query syntax
+        match = " AND ".join(f'"{term}"' for term in terms)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT messages.* FROM messages_fts JOIN messages ON messages.rowid = messages_fts.rowid "
+                "WHERE messages_fts MATCH ? ORDER BY bm25(messages_fts, 2.0, 3.0, 1.0) LIMIT ?",
+                (match, limit),
+            ).fetchall()
+        return [self._to_email(row) for row in rows]
+
+    @staticmethod
+    def _to_email(row: sqlite3.Row) -> dict:
+        return {
+            "id": row["id"],
+            "from": row["sender"],
+            "subject": row["subject"],
+            "date": row["date"],
+            "snippet": row["snippet"],
+            "potentialDates": json.loads(row["potential_dates"]),
+        }
+
+
+class MailboxSync:
+    """Keeps a MailboxStore current using Gmail history deltas.
+
+    The first sync (and any sync after the stored historyId has expired)
+    lists unread messages from scratch. Every later sync asks
+    `users.history.list` for changes since the last seen historyId, applies
+    label changes locally and only fetches metadata for new messages.
+    """
+
+    HISTORY_TYPES = ["messageAdded", "messageDeleted", "labelAdded", "labelRemoved"]
+
+    def __init__(self, store: MailboxStore, fetch_details: Callable, build_info: Callable,
+                 execute: Callable = lambda request: request.execute(),
+                 min_interval: float = 15.0, full_sync_limit: int = 500):
+        self.store = store
+        self._fetch_details = fetch_details
+        self._build_info = build_info
+        self._execute = execute
+        self.min_interval = min_interval
+        self.full_sync_limit = full_sync_limit
+        self._lock = threading.Lock()
+        self._last_sync = 0.0
+
+    def is_stale(self) -> bool:
+        return time.monotonic() - self._last_sync >= self.min_interval
+
+    def pending(self) -> List[str]:
+        """Message ids whose metadata could not be fetched on the last sync."""
+        return json.loads(self.store.get_state("pending_ids") or "[]")
+
+    def sync(self, gmail, force: bool = False):
+        with self._lock:
+            # Another caller may have synced while we waited for the lock
+            if not force and not self.is_stale():
+                return
+            history_id = self.store.get_state("history_id")
+            if history_id is None:
+                self._full_sync(gmail)
+            else:
+                try:
+                    self._incremental_sync(gmail, history_id)
+                except HttpError as e:
+                    if e.resp.status != 404:
+                        raise
+                    logger.info(f"historyId {history_id} expired, running full mailbox resync")
+                    self._full_sync(gmail)
+            self._last_sync = time.monotonic()
+
+    def _full_sync(self, gmail):
+        # Read historyId first so changes made while listing are replayed next time
+        history_id = self._execute(gmail.users().getProfile(userId="me"))["historyId"]
+        message_ids, page_token = [], None
+        while len(message_ids) < self.full_sync_limit:
+            response = self._execute(gmail.users().messages().list(
+                userId="me", q="is:unread", pageToken=page_token,
+                maxResults=min(500, self.full_sync_limit - len(message_ids)),
+                fields="messages(id),nextPageToken",
+            ))
+            message_ids += [msg["id"] for msg in response.get("messages", [])]
+            page_token = response.get("nextPageToken")
+            if not page_token:
+                break
+        self.store.reset_unread()
+        self._fetch_and_store(gmail, message_ids)
+        self.store.set_state("history_id", str(history_id))
+
+    def _incremental_sync(self, gmail, history_id: str):
+        to_fetch, deleted = set(self.pending()), set()
+        latest, page_token = history_id, None
+        while True:
+            response = self._execute(gmail.users().history().list(
+                userId="me", startHistoryId=history_id, pageToken=page_token,
+                historyTypes=self.HISTORY_TYPES,
+            ))
+            for record in response.get("history", []):
+                for item in record.get("messagesAdded", []):
+                    to_fetch.add(item["message"]["id"])
+                    deleted.discard(item["message"]["id"])
+                for item in record.get("messagesDeleted", []):
+                    deleted.add(item["message"]["id"])
+                    to_fetch.discard(item["message"]["id"])
+                for item in record.get("labelsAdded", []):
+                    message_id = item["message"]["id"]
+                    if message_id not in to_fetch and not self.store.update_labels(message_id, added=item.get("labelIds", [])):
+                        to_fetch.add(message_id)
+                for item in record.get("labelsRemoved", []):
+                    message_id = item["message"]["id"]
+                    if message_id not in to_fetch:
+                        self.store.update_labels(message_id, removed=item.get("labelIds", []))
+            latest = response.get("historyId", latest)
+            page_token = response.get("nextPageToken")
+            if not page_token:
+                break
+        self.store.delete_messages(deleted)
+        self._fetch_and_store(gmail, list(to_fetch - deleted))
+        self.store.set_state("history_id", str(latest))
+
+    def _fetch_and_store(self, gmail, message_ids: List[str]):
+        if not message_ids:
+            self.store.set_state("pending_ids", "[]")
+            return
+        details, errors = self._fetch_details(gmail, message_ids)
+        rows = []
+        for message_id, email_data in details.items():
+            try:
+                rows.append((
+                    self._build_info(message_id, email_data),
+                    email_data.get("labelIds", []),
+                    int(email_data.get("internalDate", 0)),
+                ))
+            except Exception as e:
+                errors[message_id] = e
+        self.store.upsert_messages(rows)
+        # 404s mean the message is gone; everything else is retried next sync
+        pending = [
+            message_id for message_id, exc in errors.items()
+            if not (isinstance(exc, HttpError) and exc.resp.status == 404)
+        ]
+        for message_id in pending:
+            logger.warning(f"Could not fetch message {message_id}: {errors[message_id]}")
+        self.store.set_state("pending_ids", json.dumps(pending))
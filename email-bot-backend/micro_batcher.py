@@ -0,0 +1,71 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """Coalesces single-key calls that arrive within a short window.
+
+    `submit(key)` parks the caller on a future. The first key in an empty
+    window arms a timer; when it fires (or the batch reaches `max_batch`),
+    all distinct keys are handed to `run_batch` in one call. If the batch
+    fails with an error `should_split` blames on its contents (e.g. one
+    invalid id), it is bisected and re-run so each caller gets the outcome
+    of its own key; other errors go to every caller in the batch.
+    """
+
+    def __init__(self, run_batch: Callable[[List[str]], Awaitable], window: float = 0.05, max_batch: int = 1000,
+                 should_split: Callable[[Exception], bool] = lambda exc: False):
+        self._run_batch = run_batch
+        self.window = window
+        self.max_batch = max_batch
+        self.should_split = should_split
+        self._pending: Dict[str, List[asyncio.Future]] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def submit(self, key: str):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.setdefault(key, []).append(future)
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, {}
+        if batch:
+            # The loop only keeps weak references to tasks
+            task = asyncio.ensure_future(self._send(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch: Dict[str, List[asyncio.Future]]):
+        for key, (error, result) in (await self._outcomes(list(batch))).items():
+            for future in batch[key]:
+                # Callers that hit their own deadline have already cancelled
+                if future.done():
+                    continue
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+
+    async def _outcomes(self, keys: List[str]) -> Dict[str, Tuple[Optional[Exception], object]]:
+        try:
+            result = await self._run_batch(keys)
+        except Exception as e:
+            if len(keys) > 1 and self.should_split(e):
+                middle = len(keys) // 2
+                first, second = await asyncio.gather(self._outcomes(keys[:middle]), self._outcomes(keys[middle:]))
+                return {**first, **second}
+            logger.warning(f"Batch of {len(keys)} failed: {e}")
+            return {key: (e, None) for key in keys}
+        return {key: (None, result) for key in keys}
@@ -0,0 +1,184 @@
+import asyncio
+import base64
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from email.mime.text import MIMEText
+from typing import Awaitable, Callable, List, Optional
+
+from googleapiclient.errors import HttpError
+
+from upstream_scheduler import DeadlineExceeded, is_rate_limited
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id TEXT PRIMARY KEY,
+    recipient TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    body TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    gmail_id TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    next_attempt_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (status, next_attempt_at);
+"""
+
+
+class OutboxFull(Exception):
+    pass
+
+
+def never_sent(exc: Exception) -> bool:
+    """True if the send was refused before Gmail could have delivered it, so retrying can't duplicate it."""
+    return isinstance(exc, DeadlineExceeded) or is_rate_limited(exc)
+
+
+def outcome_unknown(exc: Exception) -> bool:
+    """True if the message may have gone out even though the call failed."""
+    if isinstance(exc, DeadlineExceeded):
+        return False
+    if isinstance(exc, HttpError):
+        return exc.resp.status >= 500
+    return isinstance(exc, (TimeoutError, asyncio.TimeoutError, ConnectionError))
+
+
+def build_raw_message(recipient: str, subject: str, body: str) -> str:
+    message = MIMEText(body)
+    message["to"] = recipient
+    message["subject"] = subject
+    return base64.urlsafe_b64encode(message.as_bytes()).decode("utf-8")
+
+
+class Outbox:
+    """Durable send queue backed by SQLite and drained by a pool of workers.
+
+    `enqueue()` is a local insert, so /send-email returns as soon as the
+    message is on disk. Workers claim due rows one at a time and send them
+    through `send_raw`. messages.send is not idempotent, so only failures
+    that prove nothing was sent (quota, deadline passed before the call)
+    are rescheduled with backoff until `max_attempts`. When the outcome is
+    unknown (timeouts, 5xx, or a crash while 'sending') the row is marked
+    'unknown' for review instead, so a message is never sent twice.
+    """
+
+    def __init__(self, path: str, send_raw: Callable[[str], Awaitable[dict]], workers: int = 4,
+                 max_pending: int = 1000, max_attempts: int = 5, poll_interval: float = 5.0):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._send_raw = send_raw
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def pending_count(self) -> int:
+        with self._lock:
+            row = self._conn.execute("SELECT COUNT(*) FROM outbox WHERE status IN ('queued', 'sending')").fetchone()
+        return row[0]
+
+    def enqueue(self, recipient: str, subject: str, body: str) -> str:
+        if self.pending_count() >= self.max_pending:
+            raise OutboxFull(f"Outbox already holds {self.max_pending} unsent emails")
+        send_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO outbox (id, recipient, subject, body, created_at, updated_at, next_attempt_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (send_id, recipient, subject, body, now, now, now),
+            )
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return send_id
+
+    def get(self, send_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, status, attempts, last_error, gmail_id, created_at, updated_at FROM outbox WHERE id = ?",
+                (send_id,),
+            ).fetchone()
+        return dict(row) if row else None
+
+    def _claim(self) -> Optional[sqlite3.Row]:
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT * FROM outbox WHERE status = 'queued' AND next_attempt_at <= ? "
+                "ORDER BY next_attempt_at LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is not None:
+                self._conn.execute(
+                    "UPDATE outbox SET status = 'sending', attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                    (now, row["id"]),
+                )
+        return row
+
+    def _finish(self, send_id: str, status: str, error: Optional[str] = None,
+                gmail_id: Optional[str] = None, retry_at: Optional[float] = None):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE outbox SET status = ?, last_error = ?, gmail_id = COALESCE(?, gmail_id), "
+                "updated_at = ?, next_attempt_at = COALESCE(?, next_attempt_at) WHERE id = ?",
+                (status, error, gmail_id, time.time(), retry_at, send_id),
+            )
+
+    async def _worker(self):
+        while True:
+            row = self._claim()
+            if row is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            attempts = row["attempts"] + 1
+            try:
+                sent = await self._send_raw(build_raw_message(row["recipient"], row["subject"], row["body"]))
+            except Exception as e:
+                if never_sent(e) and attempts < self.max_attempts:
+                    retry_at = time.time() + min(300, 2 ** attempts)
+                    logger.warning(f"Send {row['id']} failed (attempt {attempts}), retrying: {e}")
+                    self._finish(row["id"], "queued", str(e), retry_at=retry_at)
+                elif outcome_unknown(e):
+                    logger.error(f"Send {row['id']} may or may not have gone out, needs review: {e!r}")
+                    self._finish(row["id"], "unknown", repr(e))
+                else:
+                    logger.error(f"Send {row['id']} failed permanently: {e}")
+                    self._finish(row["id"], "failed", str(e))
+            else:
+                self._finish(row["id"], "sent", gmail_id=sent.get("id"))
+
+    def start(self):
+        """Open the database (created on first start) and launch the workers."""
+        if self._tasks:
+            return
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.row_factory = sqlite3.Row
+            with self._lock, self._conn:
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.executescript(SCHEMA)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE outbox SET status = 'unknown', last_error = 'Interrupted while sending' WHERE status = 'sending'"
+            )
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
@@ -0,0 +1,316 @@
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from googleapiclient.errors import HttpError
+
+from metrics import UPSTREAM_RETRIES, execute as timed_execute
+
+logger = logging.getLogger(__name__)
+
+# Gmail quota units per method (https://developers.google.com/gmail/api/reference/quota).
+# Calendar has no per-method weights, so every call costs 1.
+GMAIL_QUOTA_UNITS = {
+    "gmail.users.getProfile": 1,
+    "gmail.users.history.list": 2,
+    "gmail.users.messages.list": 5,
+    "gmail.users.messages.get": 5,
+    "gmail.users.messages.modify": 5,
+    "gmail.users.messages.batchModify": 50,
+    "gmail.users.messages.send": 100,
+}
+DEFAULT_COST = {"gmail": 5, "calendar": 1}
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+RATE_LIMIT_REASONS = (b"rateLimitExceeded", b"userRateLimitExceeded")
+
+_context = threading.local()
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+@contextmanager
+def deadline_scope(deadline: Optional[float]):
+    """Attach a time.monotonic() deadline to upstream calls made on this thread."""
+    previous = getattr(_context, "deadline", None)
+    _context.deadline = deadline
+    try:
+        yield
+    finally:
+        _context.deadline = previous
+
+
+def current_deadline() -> Optional[float]:
+    return getattr(_context, "deadline", None)
+
+
+def _remaining() -> Optional[float]:
+    deadline = current_deadline()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def is_rate_limited(exc: Exception) -> bool:
+    if not isinstance(exc, HttpError):
+        return False
+    return exc.resp.status == 429 or (
+        exc.resp.status == 403 and any(reason in (exc.content or b"") for reason in RATE_LIMIT_REASONS)
+    )
+
+
+def is_retryable(exc: Exception) -> bool:
+    if isinstance(exc, DeadlineExceeded):
+        return False
+    if isinstance(exc, HttpError):
+        return exc.resp.status in RETRYABLE_STATUSES or is_rate_limited(exc)
+    return isinstance(exc, (TimeoutError, ConnectionError))
+
+
+class TokenBucket:
+    """Thread-safe token bucket measured in quota units per second."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def pause(self, seconds: float):
+        """Stop handing out tokens for a while, e.g. after a 429 with Retry-After."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def acquire(self, cost: float):
+        cost = min(cost, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if now >= self._paused_until and self._tokens >= cost:
+                    self._tokens -= cost
+                    return
+                wait = max(self._paused_until - now, (cost - self._tokens) / self.rate)
+            remaining = _remaining()
+            if remaining is not None and wait > remaining:
+                raise DeadlineExceeded("Deadline would pass while waiting for quota")
+            time.sleep(wait)
+
+
+class RetryBudget:
+    """Caps retries at a fraction of recent traffic so overload doesn't multiply.
+
+    Every request deposits `ratio` tokens and every retry withdraws one; a
+    small per-second floor keeps retries possible when traffic is light.
+    """
+
+    def __init__(self, ratio: float = 0.1, min_per_second: float = 1.0, max_tokens: float = 20.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def record_request(self):
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def try_withdraw(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.max_tokens, self._tokens + (now - self._updated) * self.min_per_second)
+            self._updated = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class UpstreamScheduler:
+    """Single gate for every Gmail and Calendar call.
+
+    Calls are admitted through a per-API token bucket sized to the quota,
+    retried with jittered backoff (honoring Retry-After) while the shared
+    retry budget allows, and never wait past the deadline set on the
+    calling thread with `deadline_scope`.
+
+    With `http_factory`, up to `batch_concurrency` batch round trips are in
+    flight at once, across all callers. httplib2 connections aren't
+    thread-safe, so each of those sender threads gets its own http object.
+    """
+
+    def __init__(self, buckets: Dict[str, TokenBucket], retry_budget: RetryBudget,
+                 max_attempts: int = 4, base_delay: float = 0.5, max_delay: float = 8.0,
+                 batch_concurrency: int = 1, http_factory: Optional[Callable[[], object]] = None):
+        self.buckets = buckets
+        self.retry_budget = retry_budget
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.batch_concurrency = batch_concurrency
+        self._http_factory = http_factory
+        self._batch_pool: Optional[ThreadPoolExecutor] = None
+        self._batch_local = threading.local()
+        self._pool_lock = threading.Lock()
+
+    @staticmethod
+    def cost_of(request) -> float:
+        method_id = getattr(request, "methodId", "") or ""
+        api = method_id.split(".", 1)[0]
+        return GMAIL_QUOTA_UNITS.get(method_id, DEFAULT_COST.get(api, 1))
+
+    def acquire(self, api: str, cost: float):
+        remaining = _remaining()
+        if remaining is not None and remaining <= 0:
+            raise DeadlineExceeded("Deadline passed before the upstream call was made")
+        bucket = self.buckets.get(api)
+        if bucket is not None:
+            bucket.acquire(cost)
+        self.retry_budget.record_request()
+
+    def execute(self, request, api: Optional[str] = None, cost: Optional[float] = None):
+        """Execute a googleapiclient request (or batch) under quota, retry budget and deadline."""
+        method = getattr(request, "methodId", None)
+        api = api or (method or "").split(".", 1)[0]
+        cost = self.cost_of(request) if cost is None else cost
+        attempt = 1
+        while True:
+            try:
+                return self._send_once(request, api, cost)
+            except Exception as exc:
+                if not self.should_retry(exc, attempt):
+                    raise
+                self.backoff(api, exc, attempt)
+                attempt += 1
+
+    def _send_once(self, request, api: str, cost: float, http=None):
+        """One admitted attempt with no retries; callers own the retry policy."""
+        self.acquire(api, cost)
+        return timed_execute(request, method=getattr(request, "methodId", None) or f"{api}.batch", http=http)
+
+    def _senders(self) -> Optional[ThreadPoolExecutor]:
+        if self.batch_concurrency <= 1 or self._http_factory is None:
+            return None
+        with self._pool_lock:
+            if self._batch_pool is None:
+                self._batch_pool = ThreadPoolExecutor(max_workers=self.batch_concurrency, thread_name_prefix="google-batch")
+        return self._batch_pool
+
+    def _sender_http(self):
+        http = getattr(self._batch_local, "http", None)
+        if http is None:
+            http = self._batch_local.http = self._http_factory()
+        return http
+
+    def execute_batch(self, service, keys: Iterable[str], make_request: Callable[[str], object],
+                      api: str, cost_per_request: float, batch_size: int = 50) -> Tuple[dict, dict]:
+        """Run one request per key through Google batch HTTP requests.
+
+        Each batch carries up to batch_size calls in a single round trip,
+        and a round's batches go out concurrently when the scheduler has
+        sender threads. Items that fail with a retryable error are re-sent
+        in the next round on their own, so one throttled item never holds up
+        the rest. Returns (results, errors), both keyed by key.
+        """
+        results, errors = {}, {}
+        pending = list(dict.fromkeys(keys))
+        deadline = current_deadline()
+        attempt = 1
+        while pending:
+            failed = {}
+
+            def callback(request_id, response, exception):
+                if exception is not None:
+                    failed[request_id] = exception
+                else:
+                    results[request_id] = response
+
+            def send(chunk: List[str], own_http: bool) -> Optional[Exception]:
+                batch = service.new_batch_http_request(callback=callback)
+                for key in chunk:
+                    batch.add(make_request(key), request_id=key)
+                try:
+                    # The deadline lives in a thread-local, so carry it over to sender threads
+                    with deadline_scope(deadline):
+                        # Sent once: failed items are retried by the next round, not by execute() as well
+                        self._send_once(batch, api, cost_per_request * len(chunk), http=self._sender_http() if own_http else None)
+                except Exception as e:
+                    return e
+                return None
+
+            chunks = [pending[start:start + batch_size] for start in range(0, len(pending), batch_size)]
+            senders = self._senders() if len(chunks) > 1 else None
+            if senders is not None:
+                outcomes = list(senders.map(lambda chunk: send(chunk, True), chunks))
+            else:
+                outcomes = [send(chunk, False) for chunk in chunks]
+            for chunk, error in zip(chunks, outcomes):
+                if error is not None:
+                    # The whole round trip failed; treat every item in it as failed
+                    for key in chunk:
+                        if key not in results:
+                            failed[key] = error
+
+            errors.update(failed)
+            for key in results:
+                errors.pop(key, None)
+            retryable = [key for key, exc in failed.items() if is_retryable(exc)]
+            if not retryable:
+                break
+            # Back off on behalf of the whole round, preferring a throttling error so its Retry-After is honored
+            exc = next((failed[key] for key in retryable if is_rate_limited(failed[key])), failed[retryable[0]])
+            if not self.should_retry(exc, attempt):
+                break
+            try:
+                self.backoff(api, exc, attempt)
+            except DeadlineExceeded:
+                break
+            pending = retryable
+            attempt += 1
+        return results, errors
+
+    def shutdown(self):
+        with self._pool_lock:
+            if self._batch_pool is not None:
+                self._batch_pool.shutdown(wait=False, cancel_futures=True)
+                self._batch_pool = None
+
+    def should_retry(self, exc: Exception, attempt: int) -> bool:
+        if attempt >= self.max_attempts or not is_retryable(exc):
+            return False
+        if not self.retry_budget.try_withdraw():
+            logger.warning("Retry budget exhausted, not retrying upstream call")
+            return False
+        return True
+
+    def backoff(self, api: str, exc: Exception, attempt: int):
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        retry_after = self._retry_after(exc)
+        if retry_after is not None:
+            delay = retry_after
+        if is_rate_limited(exc) and api in self.buckets:
+            # Hold every caller of this API back, not just this one
+            self.buckets[api].pause(delay)
+        remaining = _remaining()
+        if remaining is not None and delay >= remaining:
+            raise DeadlineExceeded("Deadline would pass before the next retry") from exc
+        logger.info(f"Retrying {api} call in {delay:.2f}s after: {exc}")
+        UPSTREAM_RETRIES.labels(api).inc()
+        time.sleep(delay)
+
+    @staticmethod
+    def _retry_after(exc: Exception) -> Optional[float]:
+        if not isinstance(exc, HttpError):
+            return None
+        value = exc.resp.get("retry-after")
+        try:
+            return float(value) if value is not None else None
+        except ValueError:
+            return None
@@ -22,6 +22,21 @@ const EmailBot = () => {
 
   useEffect(() => {
     fetchUnreadEmails();
+
+    // The backend pushes a snapshot, then {new, read, removed} diffs as the inbox changes
+    const source = new EventSource(`${API_BASE_URL}/unread-emails/stream`);
+    source.addEventListener('snapshot', (e) => {
+      setEmails(JSON.parse(e.data).emails || []);
+    });
+    source.addEventListener('diff', (e) => {
+      const diff = JSON.parse(e.data);
+      const gone = new Set([...diff.read, ...diff.removed]);
+      setEmails(prev => [
+        ...diff.new.filter(email => !prev.some(existing => existing.id === email.id)),
+        ...prev.filter(email => !gone.has(email.id))
+      ]);
+    });
+    return () => source.close();
   }, []);
 
   const fetchUnreadEmails = async () => {
@@ -53,7 +68,7 @@ const EmailBot = () => {
       await axios.post(`${API_BASE_URL}/send-email`, newEmail);
       setComposeOpen(false);
       resetComposeForm();
-      showSnackbar('Email sent successfully', 'success');
+      showSnackbar('Email queued for sending', 'success');
     } catch {
       showSnackbar('Failed to send email', 'error');
     }
@@ -116,12 +131,38 @@ const EmailBot = () => {
 
     try {
       setLoadingAI(true);
-      const response = await axios.post(`${API_BASE_URL}/generate-email`, {
-        subject: newEmail.subject
+      const response = await fetch(`${API_BASE_URL}/generate-email?stream=true`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json', Accept: 'text/event-stream' },
+        body: JSON.stringify({ subject: newEmail.subject })
       });
-      const generated = response.data.email_content || 'Generated content not available.';
+      if (!response.ok) throw new Error(`HTTP ${response.status}`);
 
-      setNewEmail(prev => ({ ...prev, body: generated }));
+      // Append tokens to the body as server-sent events arrive
+      setNewEmail(prev => ({ ...prev, body: '' }));
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      let generated = '';
+      for (;;) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split('\n\n');
+        buffer = events.pop();
+        for (const raw of events) {
+          const event = raw.match(/^event: (.*)$/m)?.[1];
+          const data = JSON.parse(raw.match(/^data: (.*)$/m)?.[1] || '{}');
+          if (event === 'error') throw new Error(data.detail);
+          if (data.token) {
+            generated += data.token;
+            setNewEmail(prev => ({ ...prev, body: generated }));
+          }
+        }
+      }
+      if (!generated) {
+        setNewEmail(prev => ({ ...prev, body: 'Generated content not available.' }));
+      }
       showSnackbar('Email body generated!', 'success');
     } catch (err) {
       console.error('AI generation failed:', err);
@@ -2,69 +2,129 @@ import sqlite3
 import os
 import shutil
 import csv
+import glob
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime, timedelta
+from urllib.request import pathname2url
 
-def get_chrome_history():
-    # Base Chrome directory on macOS
-    chrome_base = os.path.expanduser("~/Library/Application Support/Google/Chrome/")
-    
+from history_warehouse import HistoryWarehouse
+
+# Base Chrome directory on macOS
+CHROME_BASE = os.path.expanduser("~/Library/Application Support/Google/Chrome/")
+WAREHOUSE_PATH = os.getenv("HISTORY_DB_PATH", "history_warehouse.db")
+INGEST_CHUNK_SIZE = 10000
+
+def find_history_files(chrome_base=CHROME_BASE):
+    """History databases of every profile (Default, Profile 1, ...)."""
+    return sorted(glob.glob(os.path.join(glob.escape(chrome_base), "*", "History")))
+
+def file_signature(history_path):
+    """mtime and size of the database and its journal; changes whenever Chrome writes."""
+    signature = []
+    for path in (history_path, history_path + "-journal", history_path + "-wal"):
+        try:
+            stat = os.stat(path)
+            signature.append((stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            signature.append(None)
+    return tuple(signature)
+
+def open_history(history_path):
+    """Open a History database in place, read-only.
+
+    With no journal beside it the file is complete on disk and is opened
+    immutable, so SQLite takes no locks at all. Otherwise a normal read-only
+    open is tried, which fails while Chrome holds its exclusive lock.
+    """
+    uri = "file:" + pathname2url(history_path)
+    pending_write = os.path.exists(history_path + "-journal") or os.path.exists(history_path + "-wal")
+    conn = sqlite3.connect(uri + ("?mode=ro" if pending_write else "?mode=ro&immutable=1"), uri=True)
+    try:
+        # Opening is lazy; touch the schema so a locked file fails here
+        conn.execute("SELECT 1 FROM sqlite_master LIMIT 1")
+    except sqlite3.Error:
+        conn.close()
+        raise
+    return conn
+
+@contextmanager
+def profile_connection(history_path):
+    """Connection to a History database, in place if possible, else on a private copy."""
+    try:
+        conn = open_history(history_path)
+    except sqlite3.OperationalError:
+        # Locked by a running Chrome: copy into a directory of our own so concurrent runs can't collide
+        with tempfile.TemporaryDirectory(prefix="chrome_history_") as temp_dir:
+            temp_db = os.path.join(temp_dir, "History")
+            shutil.copy2(history_path, temp_db)
+            # Recent commits may live only in the WAL (or a hot rollback journal); SQLite replays it on open
+            for suffix in ("-wal", "-journal"):
+                if os.path.exists(history_path + suffix):
+                    shutil.copy2(history_path + suffix, temp_db + suffix)
+            conn = sqlite3.connect(temp_db)
+            try:
+                yield conn
+            finally:
+                conn.close()
+        return
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+def ingest_profile(warehouse, history_path):
+    """Copy visits newer than the profile's watermark into the warehouse. Returns rows read."""
+    profile_name = os.path.basename(os.path.dirname(history_path))
+    signature = repr(file_signature(history_path))
+    since, last_signature = warehouse.watermark(profile_name)
+    if last_signature == signature:
+        return 0
+
+    read = 0
+    with profile_connection(history_path) as conn:
+        # >= re-reads visits sharing the watermark's timestamp; the warehouse ignores ones it has
+        cursor = conn.execute("""
+            SELECT visits.id, visits.visit_time, urls.url, urls.title
+            FROM visits JOIN urls ON urls.id = visits.url
+            WHERE visits.visit_time >= ?
+            ORDER BY visits.visit_time
+        """, (since,))
+        while True:
+            rows = cursor.fetchmany(INGEST_CHUNK_SIZE)
+            if not rows:
+                break
+            warehouse.add_visits(profile_name, rows)
+            read += len(rows)
+    warehouse.mark_synced(profile_name, signature)
+    return read
+
+def sync_history(warehouse, chrome_base=CHROME_BASE, max_workers=8):
+    """Bring the warehouse up to date with every profile. Returns the number of visits read."""
     # Find all History files in Chrome profiles
-    history_files = []
-    for root, dirs, files in os.walk(chrome_base):
-        if "History" in files:
-            history_files.append(os.path.join(root, "History"))
+    history_files = find_history_files(chrome_base)
     
     if not history_files:
         print("No Chrome history files found!")
-        return []
-    
-    all_history = []
-    
-    for history_path in history_files:
-        temp_db = "temp_history.db"
-        
+        return 0
+
+    def safe_ingest(history_path):
         try:
-            # Make a copy of the history file
-            shutil.copy2(history_path, temp_db)
-            
-            # Connect to the copied database
-            conn = sqlite3.connect(temp_db)
-            cursor = conn.cursor()
-            
-            # Get profile name from path
-            profile_name = os.path.basename(os.path.dirname(history_path))
-            
-            # Fetch visits
-            cursor.execute("""
-                SELECT url, title, last_visit_time 
-                FROM urls 
-                ORDER BY last_visit_time DESC 
-                LIMIT 200
-            """)
-            
-            # Format results
-            for url, title, timestamp in cursor.fetchall():
-                if timestamp:
-                    epoch_start = datetime(1601, 1, 1)
-                    visit_time = epoch_start + timedelta(microseconds=timestamp)
-                    all_history.append({
-                        "time": visit_time,
-                        "title": title,
-                        "url": url,
-                        "profile": profile_name
-                    })
-            
+            return ingest_profile(warehouse, history_path)
         except Exception as e:
             print(f"Error reading {history_path}: {e}")
-        finally:
-            if 'conn' in locals():
-                conn.close()
-            if os.path.exists(temp_db):
-                os.remove(temp_db)
-    
-    # Sort all entries by time (newest first)
-    all_history.sort(key=lambda x: x["time"], reverse=True)
-    return all_history
+            return 0
+
+    # sqlite3 releases the GIL while querying, so profiles are read in parallel threads
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(history_files))) as pool:
+        return sum(pool.map(safe_ingest, history_files))
+
+def get_chrome_history(chrome_base=CHROME_BASE, warehouse=None, limit=None):
+    """Sync the warehouse, then return visits from all profiles, newest first."""
+    warehouse = warehouse or HistoryWarehouse(WAREHOUSE_PATH)
+    sync_history(warehouse, chrome_base)
+    return warehouse.recent(limit=limit)
 
 def save_to_csv(history, filename="chrome_history.csv"):
     """Save history to CSV file"""
@@ -91,28 +151,30 @@ def search_history(history, keyword):
     keyword = keyword.lower()
     return [
         h for h in history 
-        if keyword in h['title'].lower() or keyword in h['url'].lower()
+        if keyword in (h['title'] or '').lower() or keyword in h['url'].lower()
     ]
 
 def print_history(history, limit=20):
     """Print history in readable format"""
     for idx, entry in enumerate(history[:limit], 1):
         print(f"\n{idx}. {entry['time'].strftime('%Y-%m-%d %H:%M:%S')} [{entry['profile']}]")
-        print(f"Title: {entry['title']}")
+        print(f"Title: {entry['title'] or '(no title)'}")
         print(f"URL: {entry['url'][:80]}{'...' if len(entry['url']) > 80 else ''}")
 
 # Main execution
 if __name__ == "__main__":
     print("🚀 Fetching Chrome history from all profiles...")
-    history = get_chrome_history()
+    warehouse = HistoryWarehouse(WAREHOUSE_PATH)
+    new_visits = sync_history(warehouse)
+    total = warehouse.count()
     
-    if not history:
+    if not total:
         print("No history found. Possible reasons:")
         print("- Chrome is not installed in the default location")
         print("- Permission issues (try running with 'sudo')")
         exit()
     
-    print(f"\nFound {len(history)} total entries across all profiles")
+    print(f"\nFound {total} total visits across all profiles ({new_visits} read this run)")
     
     while True:
         print("\nOptions:")
@@ -125,19 +187,21 @@ if __name__ == "__main__":
         
         if choice == "1":
             days = int(input("Show history from last how many days? (1-30): ") or 1)
-            recent = filter_by_days(history, days)
+            recent = warehouse.recent(days=days)
             print(f"\n📅 Last {days} day(s) history ({len(recent)} entries):")
             print_history(recent)
             
         elif choice == "2":
-            keyword = input("Enter search keyword: ").strip()
-            results = search_history(history, keyword)
+            keyword = input("Enter search keywords (end a word with * to match prefixes): ").strip()
+            days = input("Only from the last how many days? (enter for all): ").strip()
+            since = datetime.now() - timedelta(days=int(days)) if days else None
+            results = warehouse.search(keyword, limit=50, since=since)
             print(f"\n🔍 Found {len(results)} matching entries:")
             print_history(results)
             
         elif choice == "3":
             filename = input("Enter CSV filename (default: chrome_history.csv): ").strip() or "chrome_history.csv"
-            save_to_csv(history, filename)
+            save_to_csv(warehouse.recent(), filename)
             
         elif choice == "4":
             print("Goodbye!")
@@ -0,0 +1,230 @@
+import re
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+# Chrome stores times as microseconds since 1601-01-01
+CHROME_EPOCH = datetime(1601, 1, 1)
+
+# Chrome restarts visit ids when a profile is deleted and recreated, so the id alone doesn't identify a visit
+VISITS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS visits (
+    profile TEXT NOT NULL,
+    visit_id INTEGER NOT NULL,
+    visit_time INTEGER NOT NULL,
+    url TEXT NOT NULL,
+    title TEXT,
+    PRIMARY KEY (profile, visit_id, visit_time)
+);
+CREATE INDEX IF NOT EXISTS idx_visits_time ON visits (visit_time);
+CREATE INDEX IF NOT EXISTS idx_visits_url ON visits (url, visit_time);
+"""
+SCHEMA = VISITS_SCHEMA + """
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    title TEXT,
+    domain TEXT,
+    visit_count INTEGER NOT NULL,
+    last_visit_time INTEGER NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS pages_fts USING fts5(
+    title, url, domain, content='pages', content_rowid='rowid', prefix='2 3'
+);
+CREATE TRIGGER IF NOT EXISTS pages_fts_insert AFTER INSERT ON pages BEGIN
+    INSERT INTO pages_fts (rowid, title, url, domain) VALUES (new.rowid, new.title, new.url, new.domain);
+END;
+CREATE TRIGGER IF NOT EXISTS pages_fts_delete AFTER DELETE ON pages BEGIN
+    INSERT INTO pages_fts (pages_fts, rowid, title, url, domain) VALUES ('delete', old.rowid, old.title, old.url, old.domain);
+END;
+CREATE TRIGGER IF NOT EXISTS pages_fts_update AFTER UPDATE OF title ON pages WHEN old.title IS NOT new.title BEGIN
+    INSERT INTO pages_fts (pages_fts, rowid, title, url, domain) VALUES ('delete', old.rowid, old.title, old.url, old.domain);
+    INSERT INTO pages_fts (rowid, title, url, domain) VALUES (new.rowid, new.title, new.url, new.domain);
+END;
+CREATE TABLE IF NOT EXISTS watermarks (
+    profile TEXT PRIMARY KEY,
+    visit_time INTEGER NOT NULL DEFAULT 0,
+    signature TEXT
+);
+"""
+
+SCHEMA_VERSION = 1
+
+
+def to_chrome_time(moment: datetime) -> int:
+    return (moment - CHROME_EPOCH) // timedelta(microseconds=1)
+
+
+def from_chrome_time(value: int) -> datetime:
+    return CHROME_EPOCH + timedelta(microseconds=value)
+
+
+def url_domain(url: str) -> str:
+    try:
+        host = urlsplit(url).hostname or ""
+    except ValueError:
+        return ""
+    return host[4:] if host.startswith("www.") else host
+
+
+def fts_query(query: str) -> str:
+    """All terms must match; a trailing * makes a term a prefix match (e.g. "git*")."""
+    # Quote every term so user text can't be read as FTS5 query syntax
+    return " ".join(
+        f'"{term}"' + ("*" if star else "")
+        for term, star in re.findall(r"(\w+)(\*?)", query)
+    )
+
+
+class HistoryWarehouse:
+    """Every Chrome visit ever seen, across profiles, in one local SQLite file.
+
+    Each profile has a watermark on `visit_time`; a sync only reads visits
+    at or after it, and (visit id, visit time) keys make re-reading the
+    boundary harmless, even after Chrome restarts ids for a recreated profile.
+    Rows stay here after Chrome expires them from its own History file.
+
+    Each distinct URL also gets a row in `pages` (latest title, domain,
+    visit count), which is what the FTS5 index covers, so the index grows
+    with the number of pages rather than visits. Pages are updated in the
+    same transaction as the visits that touch them.
+    """
+
+    def __init__(self, path: str = "history_warehouse.db"):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+            self._conn.create_function("url_domain", 1, url_domain, deterministic=True)
+            if self._conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+                self._migrate_visits_key()
+                self._conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            # Warehouses created before the search index existed: build pages from the stored visits once
+            if self._conn.execute("SELECT NOT EXISTS (SELECT 1 FROM pages) AND EXISTS (SELECT 1 FROM visits)").fetchone()[0]:
+                self._conn.execute(
+                    "INSERT INTO pages (url, title, domain, visit_count, last_visit_time) "
+                    "SELECT url, title, url_domain(url), COUNT(*), MAX(visit_time) FROM visits GROUP BY url"
+                )
+
+    def _migrate_visits_key(self):
+        """Rebuild a visits table keyed on (profile, visit_id) from before visit_time was part of the key."""
+        key = [row["name"] for row in self._conn.execute("PRAGMA table_info(visits)") if row["pk"]]
+        if "visit_time" in key:
+            return
+        self._conn.execute("ALTER TABLE visits RENAME TO visits_v0")
+        self._conn.execute("DROP INDEX idx_visits_time")
+        self._conn.execute("DROP INDEX idx_visits_url")
+        for statement in VISITS_SCHEMA.split(";"):
+            if statement.strip():
+                self._conn.execute(statement)
+        self._conn.execute(
+            "INSERT INTO visits (profile, visit_id, visit_time, url, title) "
+            "SELECT profile, visit_id, visit_time, url, title FROM visits_v0"
+        )
+        self._conn.execute("DROP TABLE visits_v0")
+
+    def watermark(self, profile: str) -> Tuple[int, Optional[str]]:
+        """(visit_time to resume from, file signature seen at the last sync)."""
+        with self._lock:
+            row = self._conn.execute("SELECT visit_time, signature FROM watermarks WHERE profile = ?", (profile,)).fetchone()
+        return (row["visit_time"], row["signature"]) if row else (0, None)
+
+    def add_visits(self, profile: str, rows: Iterable[Tuple[int, int, str, Optional[str]]]):
+        """Store (visit_id, visit_time, url, title) rows and move the watermark past them, atomically."""
+        rows = list(rows)
+        if not rows:
+            return
+        with self._lock, self._conn:
+            # url -> (new visits, latest visit_time, title at that visit), counting only visits not already stored
+            pages = {}
+            for visit_id, visit_time, url, title in rows:
+                inserted = self._conn.execute(
+                    "INSERT OR IGNORE INTO visits (profile, visit_id, visit_time, url, title) VALUES (?, ?, ?, ?, ?)",
+                    (profile, visit_id, visit_time, url, title),
+                ).rowcount
+                if inserted:
+                    count, latest, latest_title = pages.get(url, (0, -1, None))
+                    if visit_time >= latest:
+                        latest, latest_title = visit_time, title
+                    pages[url] = (count + 1, latest, latest_title)
+            self._conn.executemany(
+                "INSERT INTO pages (url, title, domain, visit_count, last_visit_time) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(url) DO UPDATE SET visit_count = visit_count + excluded.visit_count, "
+                "title = CASE WHEN excluded.last_visit_time >= last_visit_time THEN excluded.title ELSE title END, "
+                "last_visit_time = MAX(last_visit_time, excluded.last_visit_time)",
+                [(url, title, url_domain(url), count, latest) for url, (count, latest, title) in pages.items()],
+            )
+            self._conn.execute(
+                "INSERT INTO watermarks (profile, visit_time) VALUES (?, ?) "
+                "ON CONFLICT(profile) DO UPDATE SET visit_time = MAX(visit_time, excluded.visit_time)",
+                (profile, max(row[1] for row in rows)),
+            )
+
+    def mark_synced(self, profile: str, signature: str):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO watermarks (profile, signature) VALUES (?, ?) "
+                "ON CONFLICT(profile) DO UPDATE SET signature = excluded.signature",
+                (profile, signature),
+            )
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM visits").fetchone()[0]
+
+    def recent(self, days: Optional[float] = None, limit: Optional[int] = None) -> List[dict]:
+        """Visits newest first, optionally only from the last `days` days."""
+        query, params = "SELECT profile, visit_time, url, title FROM visits", []
+        if days is not None:
+            query += " WHERE visit_time >= ?"
+            params.append(to_chrome_time(datetime.now() - timedelta(days=days)))
+        query += " ORDER BY visit_time DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [
+            {"time": from_chrome_time(row["visit_time"]), "title": row["title"], "url": row["url"], "profile": row["profile"]}
+            for row in rows
+        ]
+
+    def search(self, query: str, limit: int = 20, since: Optional[datetime] = None,
+               until: Optional[datetime] = None) -> List[dict]:
+        """BM25-ranked search over page titles, URLs and domains.
+
+        With `since`/`until`, only pages visited in that range match, and
+        each result carries its latest visit inside the range.
+        """
+        match = fts_query(query)
+        if not match:
+            return []
+        start = to_chrome_time(since) if since else 0
+        end = to_chrome_time(until) if until else 2 ** 63 - 1
+        results = []
+        with self._lock:
+            hits = self._conn.execute(
+                "SELECT rowid FROM pages_fts WHERE pages_fts MATCH ? ORDER BY bm25(pages_fts, 3.0, 1.0, 2.0)", (match,),
+            )
+            # Look up visits only for the best-ranked pages, a batch at a time, until enough fall in range
+            while len(results) < limit:
+                batch = [row[0] for row in hits.fetchmany(max(limit, 100))]
+                if not batch:
+                    break
+                rows = self._conn.execute(
+                    "SELECT pages.rowid AS page, pages.url, pages.title, visits.visit_time, visits.profile "
+                    "FROM pages JOIN visits ON visits.rowid = ("
+                    "    SELECT rowid FROM visits WHERE url = pages.url AND visit_time >= ? AND visit_time < ? "
+                    "    ORDER BY visit_time DESC LIMIT 1) "
+                    f"WHERE pages.rowid IN ({', '.join('?' * len(batch))}) AND pages.last_visit_time >= ?",
+                    (start, end, *batch, start),
+                ).fetchall()
+                found = {row["page"]: row for row in rows}
+                results += [found[page] for page in batch if page in found]
+        return [
+            {"time": from_chrome_time(row["visit_time"]), "title": row["title"], "url": row["url"], "profile": row["profile"]}
+            for row in results[:limit]
+        ]